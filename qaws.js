@@ -6,6 +6,35 @@ function append(text) {
 // Global variable for websocket
 var websocket = null;
 
+// Images already loaded in the browser cache, and the time-to-display (ms)
+// of every image shown: {src, ms, preloaded}
+var preloadedImages = {};
+var displayTimings = [];
+
+// Warm the browser cache with the images of the next lessons
+function preloadImages(paths) {
+    paths.forEach(function(p) {
+        if (!p || preloadedImages[p]) return;
+        var img = new Image();
+        img.onload = function() { preloadedImages[p] = true; };
+        img.src = p;
+    });
+    append("preloading " + paths.length + " images");
+}
+
+// Show an image and record how long it takes to be displayed
+function showImage(p) {
+    var img = document.getElementById('image_default');
+    var t0 = performance.now();
+    var preloaded = !!preloadedImages[p];
+    img.onload = function() {
+        var ms = Math.round(performance.now() - t0);
+        displayTimings.push({src: p, ms: ms, preloaded: preloaded});
+        append("time-to-display " + p + ": " + ms + " ms" + (preloaded ? " (preloaded)" : ""));
+    };
+    img.src = p;
+}
+
 // connection function
 function wsrobot_init(ip, port) {
     var url = "ws://" + ip + ":" + port + "/modimwebsocketserver";
@@ -26,6 +55,9 @@ function wsrobot_init(ip, port) {
                         const score = parseInt(messageValue) || 0;
                         updateAttentionScore(score);
                     }
+                } else if (v[2] === 'preload') {
+                    // Images of the next lessons, separated by '|'
+                    preloadImages(messageValue.split('|'));
                 } else {
                     // Otherwise, it is plain text
                     const elementId = v[1] + '_' + v[2];
@@ -35,7 +67,7 @@ function wsrobot_init(ip, port) {
                 }
             } else if (v[1] == 'image') {
                 let p = v.slice(3).join('_');
-                document.getElementById('image_default').src = p;
+                showImage(p);
             } else if (v[1] == 'button') {
                 var b = document.createElement("button"); 
                 b.className = "btn bg-rose-600 hover:bg-rose-700 text-white text-lg py-3 px-6 rounded-xl m-2 transition";
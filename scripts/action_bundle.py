@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Compiler of the MODIM action files into one pre-resolved bundle.
+
+An action file is a list of modality blocks separated by '----':
+
+    TEXT
+    <*,*,it,*>: Testo in italiano
+    <*,*,*,*>:  Default text
+    ----
+    BUTTONS
+    key
+    <*,*,*,*>:  Label
+
+Every block is resolved for one profile (age, gender, language, role) like
+MODIM does: the most specific selector matching the profile wins, '*'
+matches anything. The bundle keeps, for each action name, the resolved
+(modality, value) pairs in file order, ready for im.executeModality, plus
+the profile it was resolved for and the modification time of every
+source file: load_bundle() returns no bundle when the files changed or
+when the profile of the session (im.profile) is another one, so actions
+are never shown in the wrong language.
+
+Broken content (unknown modality, bad selector, no text for the profile)
+makes compile_actions fail with file and line; missing images are only
+warnings unless `strict`, since MODIM then shows an empty picture.
+`python action_bundle.py` also fails on actions used by
+pepper_interaction.py that have no file. Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import ast
+import io
+import json
+import os
+
+BUNDLE_FILE = 'actions.bundle.json'
+MODALITIES = ('IMAGE', 'TEXT', 'TTS', 'BUTTONS', 'GESTURE', 'ROBOT', 'ASR')
+DEFAULT_PROFILE = ('*', '*', 'en', '*')
+
+
+class ActionError(ValueError):
+    pass
+
+
+def parse_profile(text):
+    # '<*,*,it,*>' -> ('*', '*', 'it', '*')
+    text = text.strip()
+    if not (text.startswith('<') and text.endswith('>')):
+        raise ValueError("bad profile selector %r" % text)
+    fields = tuple(f.strip() for f in text[1:-1].split(','))
+    if len(fields) != 4 or not all(fields):
+        raise ValueError("bad profile selector %r" % text)
+    return fields
+
+
+def as_profile(value):
+    # ('*', '*', 'it', '*') of '<*,*,it,*>' or of a list of 4 fields
+    if isinstance(value, (str, type(u''))):
+        return parse_profile(value)
+    return tuple(u'%s' % f for f in value)
+
+
+def init_profile(root):
+    # PROFILE line of the MODIM `init` file, the default profile of the app
+    path = os.path.join(root, 'init')
+    if os.path.exists(path):
+        with io.open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('PROFILE:'):
+                    return parse_profile(line.split(':', 1)[1])
+    return DEFAULT_PROFILE
+
+
+def resolve(entries, profile):
+    # Value of the most specific selector matching `profile`, None if none does
+    best, best_score = None, -1
+    for selector, value in entries:
+        if all(s == '*' or s == p for s, p in zip(selector, profile)):
+            score = sum(1 for s in selector if s != '*')
+            if score > best_score:
+                best, best_score = value, score
+    return best
+
+
+def parse_action(path):
+    # [(modality, entries, line)] where entries are [(selector, value)], or
+    # [(key, [(selector, label)])] for BUTTONS
+    blocks = []
+    block = None
+    with io.open(path, encoding='utf-8') as f:
+        for lineno, raw in enumerate(f, 1):
+            line = raw.strip()
+            if not line:
+                continue
+            if line.startswith('----'):
+                block = None
+                continue
+            where = "%s:%d" % (os.path.basename(path), lineno)
+            if block is None:
+                if line.split('_')[0] not in MODALITIES:
+                    raise ActionError("%s: unknown modality %r" % (where, line))
+                block = (line, [], lineno)
+                blocks.append(block)
+                continue
+            modality, entries = block[0], block[1]
+            if line.startswith('<'):
+                selector, sep, value = line.partition('>:')
+                if not sep:
+                    raise ActionError("%s: expected '<profile>: value', got %r" % (where, line))
+                try:
+                    selector = parse_profile(selector + '>')
+                except ValueError as e:
+                    raise ActionError("%s: %s" % (where, e))
+                if modality == 'BUTTONS':
+                    if not entries:
+                        raise ActionError("%s: button label before any button key" % where)
+                    entries[-1][1].append((selector, value.strip()))
+                else:
+                    entries.append((selector, value.strip()))
+            elif modality == 'BUTTONS':
+                entries.append((line, []))
+            else:
+                raise ActionError("%s: unexpected line %r in %s" % (where, line, modality))
+    return blocks
+
+
+def compile_action(path, profile, root=None, warnings=None):
+    # [(modality, value)] of one action file, resolved for `profile`.
+    # Missing images go to `warnings` if it is a list, are errors otherwise
+    name = os.path.basename(path)
+    out = []
+    for modality, entries, lineno in parse_action(path):
+        where = "%s:%d" % (name, lineno)
+        if modality == 'BUTTONS':
+            value = []
+            for key, labels in entries:
+                label = resolve(labels, profile)
+                if label is None:
+                    raise ActionError("%s: button %r has no label for profile <%s>" % (where, key, ','.join(profile)))
+                value.append([key, label])
+        else:
+            value = resolve(entries, profile)
+            if value is None:
+                raise ActionError("%s: %s has no value for profile <%s>" % (where, modality, ','.join(profile)))
+        if not value:
+            raise ActionError("%s: empty %s" % (where, modality))
+        if modality == 'IMAGE' and root is not None and not os.path.exists(os.path.join(root, value)):
+            message = "%s: image '%s' not found" % (where, value)
+            if warnings is None:
+                raise ActionError(message)
+            warnings.append(message)
+        # MODIM shows a plain TEXT block in the 'default' place
+        out.append(['TEXT_default' if modality == 'TEXT' else modality, value])
+    return out
+
+
+def action_files(actions_dir):
+    # Action names and paths, without the ':Zone.Identifier' streams and hidden files
+    for name in sorted(os.listdir(actions_dir)):
+        path = os.path.join(actions_dir, name)
+        if ':' in name or name.startswith('.') or not os.path.isfile(path):
+            continue
+        yield name, path
+
+
+def compile_actions(root, profile=None, strict=False):
+    # Bundle of every action under root/actions; raises ActionError listing
+    # all the broken files
+    profile = tuple(profile or init_profile(root))
+    actions, sources, errors = {}, {}, []
+    warnings = None if strict else []
+    for name, path in action_files(os.path.join(root, 'actions')):
+        try:
+            actions[name] = compile_action(path, profile, root, warnings)
+            sources[name] = os.path.getmtime(path)
+        except (ActionError, UnicodeDecodeError) as e:
+            errors.append(str(e) if isinstance(e, ActionError) else "%s: %s" % (name, e))
+    if errors:
+        raise ActionError("%d broken action file(s):\n  %s" % (len(errors), '\n  '.join(errors)))
+    for message in warnings or []:
+        print("WARNING: %s" % message)
+    return {'profile': list(profile), 'actions': actions, 'sources': sources}
+
+
+def save_bundle(bundle, path):
+    tmp = path + '.tmp'
+    with io.open(tmp, 'w', encoding='utf-8') as f:
+        f.write(u'%s' % json.dumps(bundle, ensure_ascii=False, sort_keys=True, separators=(',', ':')))
+    os.rename(tmp, path)
+
+
+def load_bundle(root, path=None, profile=None):
+    # The bundle of root/actions, or None if it is missing, older than the
+    # files or resolved for another profile than `profile` (when given)
+    path = path or os.path.join(root, BUNDLE_FILE)
+    if not os.path.exists(path):
+        return None
+    with io.open(path, encoding='utf-8') as f:
+        bundle = json.load(f)
+    bundled = tuple(bundle.get('profile') or ())
+    if not bundled or (profile is not None and as_profile(profile) != bundled):
+        print("WARNING: '%s' is for profile <%s>, not <%s>; action files will be parsed by MODIM"
+              % (path, ','.join(bundled), ','.join(as_profile(profile) if profile is not None else ())))
+        return None
+    current = dict((name, os.path.getmtime(p)) for name, p in action_files(os.path.join(root, 'actions')))
+    if current != bundle['sources']:
+        print("WARNING: '%s' is out of date, action files will be parsed by MODIM" % path)
+        return None
+    return bundle
+
+
+def action_images(root, names, bundle=None):
+    # Images shown by the actions `names`, in order, from the bundle when
+    # it has them, else from the action files
+    profile = bundle['profile'] if bundle else init_profile(root)
+    images = []
+    for name in names:
+        steps = bundle['actions'].get(name) if bundle else None
+        if steps is None:
+            path = os.path.join(root, 'actions', name)
+            if not os.path.isfile(path):
+                continue
+            try:
+                steps = compile_action(path, profile)
+            except (ActionError, UnicodeDecodeError):
+                continue
+        for modality, value in steps:
+            if modality == 'IMAGE' and value not in images:
+                images.append(value)
+    return images
+
+
+def button_labels(root, names):
+    # [(label, key)] of the buttons of the actions `names`, in every language
+    pairs = []
+    for name in names:
+        path = os.path.join(root, 'actions', name)
+        if not os.path.isfile(path):
+            continue
+        for modality, entries, _ in parse_action(path):
+            if modality == 'BUTTONS':
+                pairs.extend((label, key) for key, labels in entries for _, label in labels)
+    return pairs
+
+
+def _literal_str(node):
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        return None
+    return value if isinstance(value, (str, type(u''))) else None
+
+
+def referenced_actions(script_path):
+    # Action names used by the interaction script: the *_action fields of
+    # the lessons in ALL_LESSONS_DATA and the literal names given to
+    # im.execute / im.ask
+    with open(script_path, 'rb') as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Dict):
+            for key, value in zip(node.keys, node.values):
+                key = _literal_str(key) if key is not None else None
+                if key and key.endswith('_action') and _literal_str(value):
+                    names.add(_literal_str(value))
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+              and node.func.attr in ('execute', 'ask', 'run_action', 'ask_action') and node.args):
+            name = _literal_str(node.args[0])
+            if name:
+                names.add(name)
+    return names
+
+
+def main():
+    import argparse
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compile the MODIM action files into %s." % BUNDLE_FILE)
+    parser.add_argument('--root', default=os.path.dirname(here), help="MODIM app folder (with actions/)")
+    parser.add_argument('--profile', default=None,
+                        help="profile to resolve, e.g. '<*,*,it,*>' (default: PROFILE of the init file)")
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--strict', action='store_true', help="missing images are errors too")
+    parser.add_argument('--script', default=os.path.join(here, 'pepper_interaction.py'),
+                        help="interaction script whose actions must exist")
+    args = parser.parse_args()
+
+    profile = parse_profile(args.profile) if args.profile else None
+    try:
+        bundle = compile_actions(args.root, profile, args.strict)
+    except ActionError as e:
+        print("ERROR: %s" % e)
+        return 1
+
+    missing = sorted(referenced_actions(args.script) - set(bundle['actions']))
+    if missing:
+        print("ERROR: actions used by %s without a file: %s"
+              % (os.path.basename(args.script), ', '.join(missing)))
+        return 1
+
+    output = args.output or os.path.join(args.root, BUNDLE_FILE)
+    save_bundle(bundle, output)
+    print("INFO: %d actions for profile <%s> written to '%s'"
+          % (len(bundle['actions']), ','.join(bundle['profile']), output))
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
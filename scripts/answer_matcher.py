@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Grading of spoken or typed answers against the expected answer keys.
+
+Answers and synonyms are normalized to word tokens: lower case, accents
+removed ("perché" -> "perche"), anything that is not a letter or a digit
+is a separator, so the button key "the_sun" and the spoken "The Sun!"
+are the same tokens.
+
+The synonyms come from the grammar files in grammars/:
+  - <name>_<lang>.txt, one mapping per line: "gatos, gato -> cat"
+  - <name>_<lang>.grxml, the <item> words whose tag holds [answer,[nn,[cat,..]]]
+plus every answer key itself and any extra (phrase, key) pairs, such as
+the button labels of the questions. They are compiled once into a trie of
+tokens; concepts(answer) walks it from every token of the answer, taking
+the longest phrase found there and going on after it, so grading takes
+time linear in the length of the answer (times the length of the longest
+synonym), only whole words match ("pi" is not found in "pineapple") and
+the words of a longer phrase do not count on their own ("sun" is not
+found in "sun light"). Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import io
+import os
+import re
+import unicodedata
+import xml.etree.ElementTree as ET
+
+_TERMINAL = ''          # trie key holding the concept of a complete phrase
+_ANSWER_TAG = re.compile(r'answer,\[nn,\[([^,\]]+)')
+_SEPARATORS = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    # "Il Sole è..." -> ['il', 'sole', 'e']
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    text = unicodedata.normalize('NFKD', text)
+    text = u''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return [t for t in _SEPARATORS.split(text) if t]
+
+
+def grammar_language(path):
+    # 'animals_es-ES.txt' -> 'es', 'lessons_it.txt' -> 'it', 'animals.xml' -> None
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if '_' not in stem:
+        return None
+    return stem.rsplit('_', 1)[1].split('-')[0].lower()
+
+
+def read_txt_grammar(path):
+    # [(phrase, concept)] of a "a, b -> concept" file
+    pairs = []
+    with io.open(path, encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if '->' not in line:
+                raise ValueError("%s:%d: expected 'phrase, phrase -> answer'" % (path, lineno))
+            phrases, concept = line.rsplit('->', 1)
+            pairs.extend((p.strip(), concept.strip()) for p in phrases.split(',') if p.strip())
+    return pairs
+
+
+def read_grxml_grammar(path):
+    # [(phrase, concept)] of the <item>s of an SRGS grammar carrying an answer tag
+    pairs = []
+    for item in ET.parse(path).iter():
+        if not item.tag.endswith('item'):
+            continue
+        tag = next((c for c in item if c.tag.endswith('tag')), None)
+        match = _ANSWER_TAG.search(tag.text or '') if tag is not None else None
+        if match and item.text and item.text.strip():
+            pairs.append((item.text.strip(), match.group(1)))
+    return pairs
+
+
+class AnswerMatcher(object):
+
+    def __init__(self):
+        self._trie = {}
+        self.phrases = 0
+
+    def add(self, phrase, concept):
+        tokens = normalize(phrase)
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[_TERMINAL] = normalize_key(concept)
+        self.phrases += 1
+
+    def concepts(self, answer):
+        # Set of the concepts named anywhere in the answer. The longest
+        # phrase starting at a token wins and the words it covers are
+        # skipped, so "sun" is not found inside "sun light"
+        tokens = normalize(answer or '')
+        found = set()
+        start = 0
+        while start < len(tokens):
+            node = self._trie
+            concept, end = None, start + 1
+            i = start
+            while i < len(tokens):
+                node = node.get(tokens[i])
+                if node is None:
+                    break
+                i += 1
+                if _TERMINAL in node:
+                    concept, end = node[_TERMINAL], i
+            if concept is not None:
+                found.add(concept)
+            start = end
+        return found
+
+    def matches(self, answer, expected):
+        # True if the answer names the expected answer key (or a synonym of it)
+        return normalize_key(expected) in self.concepts(answer)
+
+
+def normalize_key(key):
+    return ' '.join(normalize(key))
+
+
+def compile_matcher(grammar_dir=None, answers=(), synonyms=(), languages=None):
+    # Matcher of the answer keys `answers`, of the (phrase, key) pairs
+    # `synonyms` and of the synonyms of the grammar files in grammar_dir;
+    # `languages` ('it', 'es', ...) limits the grammar files read, None
+    # reads them all
+    matcher = AnswerMatcher()
+    for answer in answers:
+        matcher.add(answer, answer)
+    for phrase, concept in synonyms:
+        matcher.add(phrase, concept)
+    if grammar_dir and os.path.isdir(grammar_dir):
+        for name in sorted(os.listdir(grammar_dir)):
+            path = os.path.join(grammar_dir, name)
+            lang = grammar_language(path)
+            if ':' in name or (languages and lang not in languages):
+                continue
+            if name.endswith('.txt'):
+                pairs = read_txt_grammar(path)
+            elif name.endswith('.grxml'):
+                pairs = read_grxml_grammar(path)
+            else:
+                continue
+            for phrase, concept in pairs:
+                matcher.add(phrase, concept)
+    return matcher
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary attention log (.atl).
+
+Layout (little endian):
+    magic        4s   b'ATLG'
+    version      H
+    header_size  H    offset of the first label
+    fps          d
+    start_time   d    unix time of the first frame, 0 if unknown
+    frame_count  Q    written on close, the file size is used if it is 0
+    source_len   H
+    source       source_len bytes, utf-8
+    labels       one byte per frame, 1 = ATTENTIVE, 0 = DISTRACTED
+
+The labeler appends labels while it produces them, the interaction side
+reads them without parsing text: with numpy the labels stay in a memory
+map of the file (a numpy view, nothing is copied), without it they are
+read in one block. Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import csv
+import mmap
+import struct
+
+try:
+    import numpy
+except ImportError:     # labels are read into a bytearray instead
+    numpy = None
+
+MAGIC = b'ATLG'
+VERSION = 1
+EXTENSION = '.atl'
+_FIXED = struct.Struct('<4sHHddQH')
+_COUNT_OFFSET = 4 + 2 + 2 + 8 + 8
+
+ATTENTIVE = 'ATTENTIVE'
+DISTRACTED = 'DISTRACTED'
+
+
+class AttentionLogWriter(object):
+
+    def __init__(self, path, fps=30.0, start_time=0.0, source='', flush_every=4096):
+        source = source.encode('utf-8')
+        self.header_size = _FIXED.size + len(source)
+        self.frame_count = 0
+        self._pending = bytearray()
+        self._flush_every = flush_every
+        self._f = open(path, 'wb')
+        self._f.write(_FIXED.pack(MAGIC, VERSION, self.header_size, float(fps),
+                                  float(start_time), 0, len(source)))
+        self._f.write(source)
+
+    def append(self, label):
+        self._pending.append(1 if label == ATTENTIVE else 0)
+        self.frame_count += 1
+        if len(self._pending) >= self._flush_every:
+            self.flush()
+
+    def flush(self):
+        self._f.write(self._pending)
+        self._f.flush()
+        del self._pending[:]
+
+    def close(self):
+        self.flush()
+        self._f.seek(_COUNT_OFFSET)
+        self._f.write(struct.pack('<Q', self.frame_count))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_binlog(path):
+    with open(path, 'rb') as f:
+        return f.read(4) == MAGIC
+
+
+def read_header(buf):
+    magic, version, header_size, fps, start_time, count, source_len = _FIXED.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("not an attention log (bad magic)")
+    if version != VERSION:
+        raise ValueError("unsupported attention log version %d" % version)
+    source = bytes(buf[_FIXED.size:_FIXED.size + source_len]).decode('utf-8')
+    available = len(buf) - header_size
+    # frame_count is 0 when the writer did not close the file (e.g. crash)
+    count = min(count, available) if count else available
+    return {"header_size": header_size, "fps": fps, "start_time": start_time,
+            "frame_count": count, "source": source}
+
+
+def read_flags(path):
+    # (header, 0/1 labels): a read-only numpy uint8 view of a memory map
+    # of the file, or a bytearray without numpy
+    with open(path, 'rb') as f:
+        if numpy is None:
+            data = f.read()
+            header = read_header(data)
+            start = header["header_size"]
+            return header, bytearray(data[start:start + header["frame_count"]])
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # the view keeps the map open, the file may be closed
+    header = read_header(mm)
+    flags = numpy.frombuffer(mm, numpy.uint8, header["frame_count"], header["header_size"])
+    return header, flags
+
+
+def iter_labels(path):
+    # (frame name, label) rows of a binary log, names are frame_0000, frame_0001, ...
+    _, flags = read_flags(path)
+    for idx, flag in enumerate(flags):
+        yield "frame_%04d" % idx, ATTENTIVE if flag else DISTRACTED
+
+
+def export_csv(path, csv_path):
+    # Same columns as the attention_log.csv written by the labeler
+    with open(csv_path, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['frame_filename', 'attention_label'])
+        for row in iter_labels(path):
+            writer.writerow(row)
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 3:
+        print("Usage: python attention_binlog.py <log.atl> <export.csv>")
+        sys.exit(1)
+    export_csv(sys.argv[1], sys.argv[2])
+    print("INFO: '%s' exported to '%s'" % (sys.argv[1], sys.argv[2]))
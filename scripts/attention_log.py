@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Attention log loaded once per process, with O(1) window scoring.
+
+The labels are kept as 0/1 flags (1 = ATTENTIVE, 0 = DISTRACTED) next to
+a cumulative-sum index, so the number of attentive frames in any window is
+one subtraction. With numpy the index is built in one vectorised pass and
+the flags of a binary log stay memory-mapped; without it both are plain
+Python arrays. Loaded logs are cached per path and reloaded only when
+the file's modification time changes. Both the attention_log.csv text
+format and the binary .atl format of attention_binlog are accepted.
+
+Imported by the MODIM interaction code, so it stays compatible with
+Python 2.7.
+"""
+from __future__ import print_function
+
+import csv
+import os
+from array import array
+
+import attention_binlog
+
+try:
+    import numpy
+except ImportError:     # prefix sums built in pure Python
+    numpy = None
+
+ATTENTIVE = 'ATTENTIVE'
+
+
+class AttentionLog(object):
+
+    def __init__(self, flags):
+        # flags: iterable of 0/1 per frame, or a numpy array of them
+        if numpy is not None:
+            if not isinstance(flags, numpy.ndarray):
+                flags = numpy.fromiter(flags, numpy.uint8)
+            self.flags = flags
+            self.prefix = numpy.zeros(len(flags) + 1, numpy.int64)
+            numpy.cumsum(flags, dtype=numpy.int64, out=self.prefix[1:])
+            return
+        self.flags = bytearray(flags)
+        self.prefix = array('I', [0])
+        total = 0
+        for f in self.flags:
+            total += f
+            self.prefix.append(total)
+
+    @classmethod
+    def from_labels(cls, labels):
+        return cls(1 if label == ATTENTIVE else 0 for label in labels)
+
+    def __len__(self):
+        return len(self.flags)
+
+    def count_attentive(self, start, end):
+        # Attentive frames in [start, end), indices are clamped to the log
+        n = len(self.flags)
+        start = max(0, min(start, n))
+        end = max(start, min(end, n))
+        return int(self.prefix[end] - self.prefix[start])
+
+    def label(self, idx):
+        return ATTENTIVE if self.flags[idx] else 'DISTRACTED'
+
+
+def read_csv_labels(path):
+    # Labels of an attention_log.csv (frame_filename, attention_label)
+    with open(path, 'r') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            yield row[1]
+
+
+# path -> (mtime, AttentionLog), shared by every lesson run of this process
+_cache = {}
+
+
+def load_cached(path):
+    # AttentionLog of `path`, parsed again only if the file changed since the last call
+    mtime = os.path.getmtime(path)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if attention_binlog.is_binlog(path):
+        _, flags = attention_binlog.read_flags(path)
+        log = AttentionLog(flags)
+    else:
+        log = AttentionLog.from_labels(read_csv_labels(path))
+    _cache[path] = (mtime, log)
+    return log
+
+
+def invalidate(path=None):
+    if path is None:
+        _cache.clear()
+    else:
+        _cache.pop(path, None)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming "closest voting" smoothing of per-frame attention labels.
+
+Each frame is relabelled with the majority label of the window of frames
+centred on it (ties go to DISTRACTED), as long as the window holds at least
+`min_coverage` frames; otherwise the frame keeps its own label. Running
+counts are kept over a window-sized buffer, so every frame costs O(1), the
+memory is bounded by the window and a label is emitted `window // 2` frames
+after it is received.
+
+The same smoother is used by the offline labeler (batch) and by the live
+attention stream, so it stays compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+from collections import deque
+
+ATTENTIVE  = 'ATTENTIVE'
+DISTRACTED = 'DISTRACTED'
+
+
+class StreamingSmoother(object):
+
+    def __init__(self, window=5, min_coverage=None):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.half = window // 2
+        # Default rule of the original labeler: at least window-1 frames
+        self.min_coverage = window - 1 if min_coverage is None else min_coverage
+        self._buf = deque()   # (frame, label) from center-half to center+half
+        self._center = 0      # position in _buf of the next frame to emit
+        self._attentive = 0
+        self._distracted = 0
+
+    def _add(self, label, step):
+        if label == ATTENTIVE:
+            self._attentive += step
+        elif label == DISTRACTED:
+            self._distracted += step
+
+    def _emit(self):
+        frame, label = self._buf[self._center]
+        if self._attentive + self._distracted >= self.min_coverage:
+            label = ATTENTIVE if self._attentive > self._distracted else DISTRACTED
+        self._center += 1
+        if self._center > self.half:
+            _, old = self._buf.popleft()
+            self._add(old, -1)
+            self._center -= 1
+        return frame, label
+
+    def push(self, frame, label):
+        # Add one frame, return the (frame, label) pairs that are now final
+        self._buf.append((frame, label))
+        self._add(label, 1)
+        if len(self._buf) - 1 - self._center >= self.half:
+            return [self._emit()]
+        return []
+
+    def flush(self):
+        # End of stream: emit the frames still waiting for their right side
+        out = []
+        while self._center < len(self._buf):
+            out.append(self._emit())
+        return out
+
+
+def smooth_stream(labels, window=5, min_coverage=None):
+    # Generator version: (frame, label) pairs in, smoothed pairs out
+    smoother = StreamingSmoother(window, min_coverage)
+    for frame, label in labels:
+        for item in smoother.push(frame, label):
+            yield item
+    for item in smoother.flush():
+        yield item
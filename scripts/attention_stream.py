@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Live attention labels, from the capture-and-label process to the interaction.
+
+live_attention_publisher.py sends one UDP datagram per smoothed frame to a
+local port, as "<capture time> <sequence> <label>". AttentionStream listens
+on that port in a background thread and keeps the most recent labels in a
+bounded ring buffer, so the interaction can score exactly the time window
+of an explanation.
+
+Imported by the MODIM interaction code, so it stays compatible with
+Python 2.7.
+"""
+from __future__ import print_function
+
+import socket
+import threading
+import time
+from collections import deque
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5055
+# About 10 minutes of labels at 30 fps
+DEFAULT_CAPACITY = 18000
+
+
+def encode_label(t_capture, seq, label):
+    return ("%.6f %d %s" % (t_capture, seq, label)).encode('ascii')
+
+
+def decode_label(data):
+    t_capture, seq, label = data.decode('ascii').split()
+    return float(t_capture), int(seq), label
+
+
+class AttentionStream(object):
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, capacity=DEFAULT_CAPACITY):
+        self._labels = deque(maxlen=capacity)    # (t_capture, label), oldest first
+        self._latencies = deque(maxlen=1000)     # capture -> received, seconds
+        self._lock = threading.Lock()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((host, port))
+        self._sock.settimeout(0.5)
+        self._running = True
+        self._thread = threading.Thread(target=self._receive, name='attention-stream')
+        self._thread.daemon = True
+        self._thread.start()
+        print("INFO: Listening for live attention labels on %s:%d" % (host, port))
+
+    def _receive(self):
+        while self._running:
+            try:
+                data = self._sock.recv(256)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            try:
+                t_capture, _, label = decode_label(data)
+            except ValueError:
+                continue
+            now = time.time()
+            with self._lock:
+                self._labels.append((t_capture, label))
+                self._latencies.append(now - t_capture)
+
+    def close(self):
+        self._running = False
+        self._thread.join(1.0)
+        self._sock.close()
+
+    def __len__(self):
+        return len(self._labels)
+
+    def labels_between(self, t_start, t_end):
+        # Labels of the frames captured in [t_start, t_end), oldest first.
+        # The buffer is walked from the newest label, so recent windows are cheap.
+        out = []
+        with self._lock:
+            for t_capture, label in reversed(self._labels):
+                if t_capture < t_start:
+                    break
+                if t_capture < t_end:
+                    out.append(label)
+        out.reverse()
+        return out
+
+    def latency_stats(self):
+        # Capture-to-receive latency of the recent labels and age of the newest one, in ms
+        with self._lock:
+            lat = sorted(self._latencies)
+            newest = self._labels[-1][0] if self._labels else None
+        if not lat:
+            return None
+        return {
+            "count": len(lat),
+            "mean_ms": 1000.0 * sum(lat) / len(lat),
+            "p95_ms": 1000.0 * lat[min(len(lat) - 1, int(0.95 * len(lat)))],
+            "max_ms": 1000.0 * lat[-1],
+            "newest_age_ms": 1000.0 * (time.time() - newest),
+        }
+
+
+# One stream per process: the MODIM server runs the interaction many times
+# and the port can only be bound once.
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_stream(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    key = (host, port)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = AttentionStream(host, port)
+        return _shared[key]
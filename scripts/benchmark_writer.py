@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only writer of benchmark_log.csv, the input of generate_graphs.py.
+
+Rows are kept in memory and appended to the file in one write() when a
+lesson or quiz ends, when `max_rows` rows are pending, when the
+interaction ends, or when the process exits (one hook for every writer
+still alive, so the writers of finished runs are not kept around). The
+file is opened in append mode for each flush and fsync'ed, so several
+sessions can share one log and a crash only loses the rows of the lesson
+in progress. Every row carries the session id and a timestamp.
+
+Logs written with the original 4-column header are upgraded once, old
+rows get empty values in the new columns. Creating the log, upgrading it
+and appending to it hold the lock of the log, so no session writes rows
+before the header or loses the rows appended meanwhile by another one.
+Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import atexit
+import os
+import threading
+import time
+import uuid
+import weakref
+
+try:
+    import fcntl
+except ImportError:     # Windows: only the threads of this process are serialized
+    fcntl = None
+
+LEGACY_FIELDS = ['TopicName', 'AttentionScore', 'IsCorrect', 'FeedbackType']
+FIELDS = LEGACY_FIELDS + ['SessionId', 'Timestamp', 'Subject', 'Mode']
+
+_writers = weakref.WeakSet()
+_file_lock = threading.Lock()
+
+
+@atexit.register
+def _flush_all():
+    for writer in list(_writers):
+        writer.flush()
+
+
+class _LogLock(object):
+    # Lock of a log shared by the threads of this process and, where
+    # fcntl is available, by other processes appending to it
+
+    def __init__(self, path):
+        self.path = path + '.lock'
+
+    def __enter__(self):
+        _file_lock.acquire()
+        self._fd = None
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        _file_lock.release()
+
+
+def _text(value):
+    if value is None:
+        return u''
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, float):
+        return u'%.2f' % value
+    return u'%s' % (value,)
+
+
+def csv_line(values):
+    # One CSV line, quoting only the fields that need it
+    out = []
+    for value in values:
+        text = _text(value)
+        if any(c in text for c in u',"\n\r'):
+            text = u'"%s"' % text.replace(u'"', u'""')
+        out.append(text)
+    return u','.join(out) + u'\n'
+
+
+def _ensure_header(path):
+    # Create the log with its header, or upgrade a legacy log, exactly once
+    with _LogLock(path):
+        with open(path, 'ab+') as f:
+            f.seek(0)
+            header = f.readline().decode('utf-8').strip()
+            if not header:
+                # new (or empty) log
+                f.write(csv_line(FIELDS).encode('utf-8'))
+                return
+            rest = f.read()
+        if header != u','.join(LEGACY_FIELDS):
+            return
+        padding = u',' * (len(FIELDS) - len(LEGACY_FIELDS))
+        lines = [line + padding.encode('utf-8') for line in rest.splitlines() if line.strip()]
+        tmp = '%s.%d.%s.tmp' % (path, os.getpid(), uuid.uuid4().hex[:8])
+        with open(tmp, 'wb') as f:
+            f.write(csv_line(FIELDS).encode('utf-8'))
+            for line in lines:
+                f.write(line + b'\n')
+        os.rename(tmp, path)
+    print("INFO: '%s' upgraded to the columns %s" % (path, ', '.join(FIELDS)))
+
+
+class BenchmarkWriter(object):
+
+    def __init__(self, path, session_id=None, max_rows=20, clock=None):
+        self.path = path
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.max_rows = max_rows
+        self.clock = clock or time.time
+        self.rows_written = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        _ensure_header(path)
+        _writers.add(self)
+
+    def add(self, topic, attention_score, is_correct, feedback_type, subject=None, mode='lesson'):
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(self.clock()))
+        row = [topic, attention_score, 1 if is_correct else 0, feedback_type,
+               self.session_id, stamp, subject, mode]
+        with self._lock:
+            self._pending.append(csv_line(row))
+            full = len(self._pending) >= self.max_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        # Append the pending rows in a single write
+        with self._lock:
+            if not self._pending:
+                return
+            data = u''.join(self._pending).encode('utf-8')
+            count = len(self._pending)
+            del self._pending[:]
+        with _LogLock(self.path):
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        self.rows_written += count
@@ -0,0 +1,179 @@
+import argparse
+import csv
+import itertools
+
+import numpy as np
+
+from frame_feature_cache import FeatureCache, source_id
+from offline_labeler_with_eye_tracking import check_cached_settings
+
+
+# ---------------------
+# Initial configuration
+# ---------------------
+# Values tried for each iris threshold and for the smoothing window
+X_LEFT_VALUES  = [0.20, 0.25, 0.30, 0.35, 0.40]
+X_RIGHT_VALUES = [0.60, 0.65, 0.70, 0.75, 0.80]
+Y_UP_VALUES    = [0.20, 0.25, 0.30, 0.35, 0.40]
+Y_DOWN_VALUES  = [0.60, 0.65, 0.70, 0.75, 0.80]
+WINDOWS        = [1, 3, 5, 7, 9]
+
+OUTPUT_FILE = 'calibration_results.csv'
+
+
+# ---------------------
+# Functions of utilities
+# ---------------------
+def load_ground_truth(path):
+    # Hand-labeled frames, same format as attention_log.csv
+    truth = {}
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            truth[row[0]] = row[1].strip().upper() == 'ATTENTIVE'
+    return truth
+
+
+def raw_labels(positions, x_left, x_right, y_up, y_down):
+    # ATTENTIVE mask for every threshold combination at once.
+    # Both eyes must be inside the range, so only the extreme iris position
+    # of each frame matters. Returns (len(x_left), len(x_right), len(y_up),
+    # len(y_down), N) booleans; NaN positions (no face) are never attentive.
+    with np.errstate(invalid='ignore'):
+        nx_min, nx_max = positions[:, :, 0].min(axis=1), positions[:, :, 0].max(axis=1)
+        ny_min, ny_max = positions[:, :, 1].min(axis=1), positions[:, :, 1].max(axis=1)
+        x_ok = ((nx_min >= np.asarray(x_left)[:, None, None]) &
+                (nx_max <= np.asarray(x_right)[None, :, None]))
+        y_ok = ((ny_min >= np.asarray(y_up)[:, None, None]) &
+                (ny_max <= np.asarray(y_down)[None, :, None]))
+    return x_ok[:, :, None, None, :] & y_ok[None, None, :, :, :]
+
+
+def smooth_batch(attentive, window, min_coverage=None):
+    # Closest voting smoothing along the last axis, same rule as the labeler,
+    # computed with a cumulative sum for every row at once
+    n = attentive.shape[-1]
+    half = window // 2
+    if min_coverage is None:
+        min_coverage = window - 1
+    csum = np.concatenate([np.zeros(attentive.shape[:-1] + (1,), dtype=np.int32),
+                           np.cumsum(attentive, axis=-1, dtype=np.int32)], axis=-1)
+    idx = np.arange(n)
+    lo = np.maximum(idx - half, 0)
+    hi = np.minimum(idx + half, n - 1) + 1
+    att = csum[..., hi] - csum[..., lo]
+    total = hi - lo
+    return np.where(total >= min_coverage, att > total - att, attentive)
+
+
+def scores(predicted, truth):
+    # Accuracy, precision and recall (ATTENTIVE is the positive class) along the last axis
+    tp = (predicted & truth).sum(axis=-1)
+    fp = (predicted & ~truth).sum(axis=-1)
+    fn = (~predicted & truth).sum(axis=-1)
+    accuracy = (predicted == truth).mean(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.nan_to_num(tp / (tp + fp))
+        recall = np.nan_to_num(tp / (tp + fn))
+    return accuracy, precision, recall
+
+
+def sweep(positions, gt_idx, gt_labels, grid, windows, min_coverage=None):
+    # Evaluate every (threshold, window) combination, return a list of result rows
+    x_left, x_right, y_up, y_down = grid
+    rows = []
+    for window in windows:
+        # One x_left value at a time keeps the (combinations x frames) arrays small
+        for a, xl in enumerate(x_left):
+            attentive = raw_labels(positions, [xl], x_right, y_up, y_down)[0]
+            smoothed = smooth_batch(attentive, window, min_coverage)[..., gt_idx]
+            accuracy, precision, recall = scores(smoothed, gt_labels)
+            for b, c, d in itertools.product(range(len(x_right)), range(len(y_up)), range(len(y_down))):
+                if xl >= x_right[b] or y_up[c] >= y_down[d]:
+                    continue
+                rows.append({
+                    "x_left": xl, "x_right": x_right[b],
+                    "y_up": y_up[c], "y_down": y_down[d], "window": window,
+                    "accuracy": float(accuracy[b, c, d]),
+                    "precision": float(precision[b, c, d]),
+                    "recall": float(recall[b, c, d]),
+                })
+    return rows
+
+
+def save_results(rows, path=OUTPUT_FILE):
+    fields = ["x_left", "x_right", "y_up", "y_down", "window", "accuracy", "precision", "recall"]
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: (f"{v:.4f}" if isinstance(v, float) else v) for k, v in row.items()})
+    print(f"INFO: {len(rows)} settings saved to '{path}'")
+
+
+# ---------------------
+# Main Processing
+# ---------------------
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Grid search of the labeler thresholds and smoothing window on cached features.")
+    parser.add_argument('--cache', required=True,
+                        help="feature cache written by offline_labeler_with_eye_tracking.py --cache")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--folder', help="frame folder labeled into the cache")
+    source.add_argument('--video', help="video file labeled into the cache")
+    parser.add_argument('--track', action='store_true',
+                        help="the source was labeled with --track")
+    parser.add_argument('--ground-truth', required=True,
+                        help="CSV of hand-labeled frames (frame_filename, attention_label)")
+    parser.add_argument('--x-left', type=float, nargs='+', default=X_LEFT_VALUES)
+    parser.add_argument('--x-right', type=float, nargs='+', default=X_RIGHT_VALUES)
+    parser.add_argument('--y-up', type=float, nargs='+', default=Y_UP_VALUES)
+    parser.add_argument('--y-down', type=float, nargs='+', default=Y_DOWN_VALUES)
+    parser.add_argument('--windows', type=int, nargs='+', default=WINDOWS)
+    parser.add_argument('--min-coverage', type=int, default=None,
+                        help="frames needed in the window to relabel a frame (default: window-1)")
+    parser.add_argument('--metric', choices=['accuracy', 'precision', 'recall'], default='accuracy',
+                        help="score used to pick the best setting (default: %(default)s)")
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cache = FeatureCache(args.cache)
+    source = source_id(args.video or args.folder)
+    names, positions = cache.load_sequence(source)
+    if not names:
+        raise SystemExit("ERROR: this source is not in the cache, label it once with --cache first.")
+    check_cached_settings(cache, source, args.track)
+    cache.close()
+
+    truth = load_ground_truth(args.ground_truth)
+    gt_idx = np.array([i for i, name in enumerate(names) if name in truth], dtype=int)
+    if gt_idx.size == 0:
+        raise SystemExit("ERROR: none of the ground-truth frames is in the cached sequence.")
+    gt_labels = np.array([truth[names[i]] for i in gt_idx])
+    print(f"INFO: {len(names)} cached frames, {gt_idx.size} with ground truth.")
+
+    grid = (args.x_left, args.x_right, args.y_up, args.y_down)
+    rows = sweep(positions, gt_idx, gt_labels, grid, args.windows, args.min_coverage)
+    if not rows:
+        raise SystemExit("ERROR: empty grid, every x_left/y_up must be below some x_right/y_down.")
+    rows.sort(key=lambda r: (r[args.metric], r["accuracy"]), reverse=True)
+    save_results(rows, args.output)
+
+    print(f"\n==== TOP SETTINGS BY {args.metric.upper()} ====")
+    for r in rows[:5]:
+        print(f"thresholds=({r['x_left']:.2f}, {r['x_right']:.2f}, {r['y_up']:.2f}, {r['y_down']:.2f}) "
+              f"window={r['window']}: accuracy={r['accuracy']:.3f} "
+              f"precision={r['precision']:.3f} recall={r['recall']:.3f}")
+    best = rows[0]
+    print("\nBest setting, to use with the labeler:")
+    print(f"  --thresholds {best['x_left']} {best['x_right']} {best['y_up']} {best['y_down']} "
+          f"--window {best['window']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the NAOqi `qi` module, to run and test off-robot.
+
+Session mimics qi.Session (connect, isConnected, service, close). Services
+accept any method call, record it and return None; a few methods return
+what the real service does. disconnect_all() simulates the robot dropping
+the connection: calls on old sessions then raise RuntimeError, like qi.
+
+Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import threading
+import time
+
+# Every call made on any fake service: (time, service, method, args)
+calls = []
+_calls_lock = threading.Lock()
+_generation = [0]
+
+# Return values of methods that do not return None on the robot
+_RESULTS = {
+    ('ALTabletService', 'loadUrl'): True,
+    ('ALTabletService', 'showWebview'): True,
+    ('ALTabletService', 'preLoadImage'): True,
+    ('ALTextToSpeech', 'getLanguage'): 'Italian',
+}
+
+
+def disconnect_all():
+    # Simulate a network drop of every open session
+    _generation[0] += 1
+
+
+def reset():
+    with _calls_lock:
+        del calls[:]
+
+
+class Session(object):
+
+    def __init__(self):
+        self.url = None
+        self._generation = None
+
+    def connect(self, url):
+        self.url = url
+        self._generation = _generation[0]
+
+    def isConnected(self):
+        return self._generation == _generation[0]
+
+    def service(self, name):
+        if not self.isConnected():
+            raise RuntimeError("fake_naoqi: session not connected")
+        return FakeService(self, name)
+
+    def close(self):
+        self._generation = None
+
+
+class FakeService(object):
+
+    def __init__(self, session, name, prefix=()):
+        self._session = session
+        self._name = name
+        self._prefix = prefix
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return FakeService(self._session, self._name, self._prefix + (attr,))
+
+    def __call__(self, *args, **kwargs):
+        if not self._session.isConnected():
+            raise RuntimeError("fake_naoqi: connection lost")
+        method = '.'.join(self._prefix)
+        with _calls_lock:
+            calls.append((time.time(), self._name, method, args))
+        return _RESULTS.get((self._name, self._prefix[-1]))
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+
+
+# ---------------------
+# Per-frame feature cache
+# ---------------------
+# Stores the expensive results of the labeler (face bbox and normalized
+# iris positions) in a SQLite file, keyed by a hash of the frame content.
+# The order in which a source (folder or video) was labeled is stored too,
+# so the labels can be recomputed with new thresholds without touching the
+# images again.
+#
+# Features depend on the labeler settings (face upscaling, tracking) as
+# well as on the pixels: the keys mix in a settings tag (settings_key), so
+# frames labeled with other settings are computed again, and the tag of
+# the last labeling of a source is stored with its sequence, so
+# relabeling and calibration refuse features of other settings.
+#
+# Missing values mean: no bbox -> no face found, no positions -> the face
+# was found but FaceMesh returned no landmarks.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    key BLOB PRIMARY KEY,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    lx REAL, ly REAL, rx REAL, ry REAL
+);
+CREATE TABLE IF NOT EXISTS frames (
+    source TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    fname TEXT NOT NULL,
+    key BLOB NOT NULL,
+    PRIMARY KEY (source, idx)
+);
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    settings TEXT NOT NULL
+);
+"""
+
+
+def frame_key(data):
+    # Content hash of a frame: raw file bytes or decoded pixels
+    if isinstance(data, np.ndarray):
+        data = np.ascontiguousarray(data).data
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def settings_key(key, settings):
+    # Cache key of the features of a frame computed with the given settings tag
+    return frame_key(key + settings.encode('utf-8'))
+
+
+class FeatureCache:
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            self._conn = sqlite3.connect(path)
+            # WAL lets the pool workers read while the main process writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def get_many(self, keys):
+        # {key: (bbox, positions)} for the keys present in the cache
+        found = {}
+        keys = list(set(keys))
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            rows = self._conn.execute(
+                "SELECT key, x1, y1, x2, y2, lx, ly, rx, ry FROM features "
+                f"WHERE key IN ({','.join('?' * len(part))})", part)
+            for key, x1, y1, x2, y2, lx, ly, rx, ry in rows:
+                found[key] = _unpack(x1, y1, x2, y2, lx, ly, rx, ry)
+        return found
+
+    def clear_sequence(self, source, settings):
+        # Forget the frame order of a source before labeling it again with `settings`
+        with self._conn:
+            self._conn.execute("DELETE FROM frames WHERE source = ?", (source,))
+            self._conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, settings))
+
+    def sequence_settings(self, source):
+        # Settings tag of the last labeling of a source, None if unknown
+        row = self._conn.execute("SELECT settings FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def store(self, source, start_idx, features):
+        # Save the features of consecutive frames and their position in the source
+        rows, order = [], []
+        for offset, feat in enumerate(features):
+            x1 = y1 = x2 = y2 = lx = ly = rx = ry = None
+            if feat.bbox is not None:
+                x1, y1, x2, y2 = (int(v) for v in feat.bbox)
+            if feat.positions is not None:
+                (lx, ly), (rx, ry) = feat.positions.tolist()
+            rows.append((feat.key, x1, y1, x2, y2, lx, ly, rx, ry))
+            order.append((source, start_idx + offset, feat.fname, feat.key))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?)", order)
+
+    def iter_sequence(self, source, chunk_size=1024):
+        # Yield (names, positions) chunks of a labeled source, in frame order.
+        # positions is a (n, 2, 2) array, NaN for frames without landmarks.
+        cur = self._conn.execute(
+            "SELECT fr.fname, f.lx, f.ly, f.rx, f.ry FROM frames fr "
+            "JOIN features f ON f.key = fr.key "
+            "WHERE fr.source = ? ORDER BY fr.idx", (source,))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            names = [r[0] for r in rows]
+            positions = np.array([r[1:] for r in rows], dtype=float).reshape(-1, 2, 2)
+            yield names, positions
+
+    def load_sequence(self, source):
+        # Whole sequence of a source as (names, positions)
+        names, parts = [], []
+        for chunk_names, positions in self.iter_sequence(source):
+            names.extend(chunk_names)
+            parts.append(positions)
+        return names, (np.concatenate(parts) if parts else np.empty((0, 2, 2)))
+
+
+def source_id(path):
+    # Name under which the frame order of a folder or video is stored
+    return os.path.abspath(path)
+
+
+def _unpack(x1, y1, x2, y2, lx, ly, rx, ry):
+    bbox = None if x1 is None else (x1, y1, x2, y2)
+    positions = None if lx is None else np.array([[lx, ly], [rx, ry]])
+    return bbox, positions
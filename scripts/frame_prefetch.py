@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from frame_feature_cache import frame_key
+
+
+# ---------------------
+# Read-ahead of the labeler frames
+# ---------------------
+# The frames are listed (or decoded from the video) in a background thread
+# and read, optionally decoded, by a pool of I/O threads, up to `depth`
+# frames ahead of the consumer. On disks where every file has a high
+# latency, the reads overlap with each other and with the inference;
+# file reads and cv2.imdecode release the GIL.
+#
+# Frames come out in order as (name, key, data) triples: `key` is the
+# content hash used by the feature cache, `data` the raw file bytes or the
+# decoded image. With decode_scale 2, 4 or 8 JPEG/PNG files are decoded
+# directly at reduced resolution (video frames are resized), and the key
+# changes with the scale so cached features of different scales never mix.
+
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+_END = object()
+
+
+def scaled_key(key, scale):
+    return key if scale == 1 else frame_key(key + b'@%d' % scale)
+
+
+def decode_image(buf, scale=1):
+    # BGR image of the raw bytes of an image file, None if unreadable
+    return cv2.imdecode(buf, DECODE_FLAGS[scale]) if buf.size else None
+
+
+def load_frame(frame, scale=1, decode=True):
+    # (name, key, data) of an image path or of a (name, image) video frame
+    if isinstance(frame, str):
+        buf = np.fromfile(frame, dtype=np.uint8)
+        key = scaled_key(frame_key(buf), scale)
+        return os.path.basename(frame), key, (decode_image(buf, scale) if decode else buf)
+    fname, img = frame
+    key = scaled_key(frame_key(img), scale)
+    if scale != 1:
+        img = cv2.resize(img, None, fx=1.0 / scale, fy=1.0 / scale, interpolation=cv2.INTER_AREA)
+    return fname, key, img
+
+
+class PrefetchStats:
+
+    def __init__(self):
+        self.frames = 0
+        self.stalls = 0          # frames the consumer had to wait for
+        self.stall_time = 0.0    # seconds spent waiting
+        self.read_time = 0.0     # seconds spent reading/decoding, summed over the threads
+        self.depth_sum = 0
+        self.depth_max = 0
+
+    def add(self, depth, stalled, waited, read_time):
+        self.frames += 1
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.read_time += read_time
+        if stalled:
+            self.stalls += 1
+            self.stall_time += waited
+
+    def summary(self):
+        if not self.frames:
+            return "prefetch: no frames"
+        return (f"prefetch: {self.frames} frames, queue depth mean {self.depth_sum / self.frames:.1f} "
+                f"max {self.depth_max}, {self.stalls} stalls ({100.0 * self.stalls / self.frames:.1f}%, "
+                f"{self.stall_time:.2f} s waited), read+decode {1000.0 * self.read_time / self.frames:.1f} ms/frame")
+
+
+def prefetch_frames(frames, threads=8, depth=64, scale=1, decode=True, stats=None):
+    # Yield the (name, key, data) of every frame, in order, loaded up to
+    # `depth` frames ahead by `threads` threads. Unreadable images come
+    # out with data None.
+    if scale not in DECODE_FLAGS:
+        raise ValueError(f"decode scale must be one of {sorted(DECODE_FLAGS)}")
+    stats = stats if stats is not None else PrefetchStats()
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def _load(frame):
+        start = time.perf_counter()
+        return load_frame(frame, scale, decode), time.perf_counter() - start
+
+    def _list(pool):
+        try:
+            for frame in frames:
+                if stop.is_set():
+                    break
+                pending.put(pool.submit(_load, frame))
+        except Exception as e:
+            pending.put(e)
+        finally:
+            pending.put(_END)
+
+    with ThreadPoolExecutor(threads) as pool:
+        lister = threading.Thread(target=_list, args=(pool,), daemon=True)
+        lister.start()
+        try:
+            while True:
+                depth_now = pending.qsize()
+                start = time.perf_counter()
+                try:
+                    item = pending.get_nowait()
+                    stalled = False
+                except queue.Empty:
+                    item = pending.get()
+                    stalled = True
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                stalled = stalled or not item.done()
+                result, read_time = item.result()
+                stats.add(depth_now, stalled, time.perf_counter() - start, read_time)
+                yield result
+        finally:
+            # unblock the lister if the consumer stopped early
+            stop.set()
+            while lister.is_alive():
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    lister.join(0.05)
@@ -1,78 +1,400 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
+import hashlib
+import io
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
 
-LOG_FILE_PATH = 'benchmark_log.csv' 
+LOG_FILE_PATH = 'benchmark_log.csv'
 OUTPUT_DIR = 'benchmark_graphs'
+CHUNK_ROWS = 100000
+NUM_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+# Columns added by benchmark_writer; older logs get them filled with this value
+EXTRA_COLUMNS = ['SessionId', 'Subject', 'Mode']
+UNKNOWN = 'unknown'
+MAX_BARS = 30       # above this, breakdowns are drawn as lines
+STORE_FILE = 'aggregates.pkl'   # running aggregates, kept in the output folder
+STORE_VERSION = 2               # stores of another version are rebuilt
+TREND_ROWS = 200    # latest scored answers drawn by the attention trend
+
+
+# ---------------------
+# Chunked aggregation
+# ---------------------
+# Every breakdown is a small table indexed by the key (topic, session or
+# subject), in order of first appearance in the log, with the columns:
+#   attention_sum, attention_n  -> mean attention (rows without a score skipped)
+#   correct, answers            -> success rate
+AGG_COLUMNS = ['attention_sum', 'attention_n', 'correct', 'answers']
+BREAKDOWNS = {'topics': 'TopicName', 'sessions': 'SessionId', 'subjects': 'Subject'}
+# The attention trend keeps the last TREND_ROWS scored rows themselves
+# (TopicName, attention), in log order: the log is append-only, so this is
+# the order in which the answers were given.
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        line = f.readline()
+    return line, len(line)
+
+
+def read_chunks(path, start, chunk_rows):
+    # (rows, byte offset after them) of the complete records after `start`,
+    # by chunks of chunk_rows. A record ends at a newline outside quotes
+    # (benchmark_writer quotes fields holding newlines); a record still
+    # being written is left for the next run.
+    header, _ = read_header(path)
+    names = header.decode('utf-8').strip().split(',')
+    with open(path, 'rb') as f:
+        f.seek(start)
+        records, record, quotes, end = [], [], 0, start
+        for line in iter(f.readline, b''):
+            record.append(line)
+            quotes += line.count(b'"')
+            if quotes % 2 or not line.endswith(b'\n'):
+                continue
+            records.append(b''.join(record))
+            end += len(records[-1])
+            record, quotes = [], 0
+            if len(records) == chunk_rows:
+                yield parse_records(records, names), end
+                records = []
+        if records:
+            yield parse_records(records, names), end
+
+
+def parse_records(records, names):
+    chunk = pd.read_csv(io.BytesIO(b''.join(records)), names=names, header=None)
+    for col in EXTRA_COLUMNS:
+        if col not in names:
+            chunk[col] = UNKNOWN
+    chunk[EXTRA_COLUMNS] = chunk[EXTRA_COLUMNS].fillna(UNKNOWN)
+    return chunk
+
+
+def partial_aggregate(chunk, key):
+    score = pd.to_numeric(chunk['AttentionScore'], errors='coerce')
+    part = pd.DataFrame({
+        key: chunk[key].astype(str),
+        'attention_sum': score.fillna(0.0),
+        'attention_n': score.notna().astype(int),
+        'correct': chunk['IsCorrect'].astype(int),
+        'answers': 1,
+    })
+    return part.groupby(key, sort=False)[AGG_COLUMNS].sum()
+
+
+def scored_rows(chunk):
+    score = pd.to_numeric(chunk['AttentionScore'], errors='coerce')
+    rows = pd.DataFrame({'TopicName': chunk['TopicName'].astype(str), 'attention': score})
+    return rows[score.notna()]
+
+
+def merge(total, part):
+    if total is None:
+        return part
+    return pd.concat([total, part]).groupby(level=0, sort=False).sum()
+
+
+def fold(tables, path, start, chunk_rows=CHUNK_ROWS):
+    # Add the complete rows after byte offset `start` to the running sums;
+    # returns the tables and the offset where the rows read end. Memory
+    # depends on the number of distinct keys only
+    tables = dict(tables) if tables else dict.fromkeys(list(BREAKDOWNS) + ['trend'])
+    end = start
+    for chunk, end in read_chunks(path, start, chunk_rows):
+        for name, key in BREAKDOWNS.items():
+            tables[name] = merge(tables[name], partial_aggregate(chunk, key))
+        trend = pd.concat([tables['trend'], scored_rows(chunk)], ignore_index=True)
+        tables['trend'] = trend.tail(TREND_ROWS).reset_index(drop=True)
+    return tables, end
+
+
+def finish(tables):
+    # Means and rates of the running sums, as plotted
+    if tables is None or tables['topics'] is None:
+        return None
+    out = {'trend': tables['trend']}
+    for name in BREAKDOWNS:
+        table = tables[name].copy()
+        table['attention'] = table['attention_sum'] / table['attention_n'].where(table['attention_n'] > 0)
+        table['success'] = 100.0 * table['correct'] / table['answers']
+        out[name] = table
+    return out
+
+
+# ---------------------
+# Aggregate store
+# ---------------------
+# The benchmark log is append-only, so the store keeps the sums of the rows
+# read so far with the byte offset where they end. The next run folds in
+# only the bytes after it. A rewritten log (different header, e.g. after the
+# benchmark_writer upgrade, shorter file, or different bytes just before the
+# offset) is aggregated again from scratch; use --full after hand edits.
+def _tail_digest(path, offset, size=1024):
+    with open(path, 'rb') as f:
+        f.seek(max(0, offset - size))
+        return hashlib.blake2b(f.read(offset - max(0, offset - size)), digest_size=16).hexdigest()
+
+
+def load_store(store_path, log_path):
+    if not os.path.exists(store_path):
+        return None
+    try:
+        with open(store_path, 'rb') as f:
+            store = pickle.load(f)
+    except Exception as e:
+        print("WARNING: aggregate store '{}' unreadable ({}), rebuilding".format(store_path, e))
+        return None
+    header, _ = read_header(log_path)
+    if store.get('version') != STORE_VERSION:
+        print("INFO: aggregate store '{}' is of an older version, rebuilding".format(store_path))
+        return None
+    if (store.get('log') != os.path.abspath(log_path) or store.get('header') != header
+            or os.path.getsize(log_path) < store['offset']
+            or _tail_digest(log_path, store['offset']) != store['tail']):
+        print("INFO: '{}' was rewritten, aggregating it from scratch".format(log_path))
+        return None
+    return store
+
+
+def save_store(store_path, store):
+    tmp = store_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(store, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, store_path)
+
+
+def update_store(store_path, log_path, chunk_rows=CHUNK_ROWS, rebuild=False):
+    # Fold the new rows of the log into the stored sums; returns the store
+    # and the number of bytes read
+    store = None if rebuild else load_store(store_path, log_path)
+    header, header_size = read_header(log_path)
+    if store is None:
+        store = {'version': STORE_VERSION, 'log': os.path.abspath(log_path), 'header': header,
+                 'offset': header_size, 'tables': None, 'figures': {}}
+    start = store['offset']
+    tables, end = fold(store['tables'], log_path, start, chunk_rows)
+    if end > start:
+        store['tables'] = tables
+        store['offset'] = end
+        store['tail'] = _tail_digest(log_path, end)
+        save_store(store_path, store)
+    elif 'tail' not in store:
+        store['tail'] = _tail_digest(log_path, start)
+    return store, max(0, end - start)
+
+
+# ---------------------
+# Figures
+# ---------------------
+# Each function draws one figure from the aggregated tables and returns it.
+# pyplot and seaborn are imported here, so batch workers can pick the
+# backend before the first import.
+def plot_attention_vs_success(tables):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    topics = tables['topics'].reset_index()
+    fig = plt.figure(figsize=(12, 7))
+    ax = sns.barplot(x='TopicName', y='attention', data=topics, color='lightblue', label='Attention Score (%)')
+
+    # Overlay a dot chart with the share of right answers of every topic
+    sns.scatterplot(x='TopicName', y='success', data=topics, hue=topics['success'] >= 50,
+                    palette={True: 'green', False: 'red'}, s=150, ax=ax, edgecolor='black', legend=False)
+    ax.scatter([], [], c='green', edgecolors='black', label='Mostly Correct (%)')
+    ax.scatter([], [], c='red', edgecolors='black', label='Mostly Incorrect (%)')
+
+    plt.title('Attention Score and Answer Correctness per Topic', fontsize=16)
+    plt.xlabel('Topic', fontsize=12)
+    plt.ylabel('Attention Score / Correct Answers (%)', fontsize=12)
+    plt.xticks(rotation=25, ha='right')
+    plt.ylim(0, 110)
+    plt.legend(title='Outcome')
+    plt.tight_layout()
+    return fig
+
 
-if not os.path.exists(LOG_FILE_PATH):
-    print("ERRORE: File not found in '{}'".format(LOG_FILE_PATH))
-    exit()
-
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-
-df = pd.read_csv(LOG_FILE_PATH)
-
-if df.empty:
-    print("WARNING: The log file '{}' is empty. Unable to generate graphs.".format(LOG_FILE_PATH))
-    exit()
-
-sns.set_style("whitegrid")
-
-# --- GRAPH 1: FOCUS vs SUCCESS ---
-plt.figure(figsize=(12, 7))
-ax = sns.barplot(x='TopicName', y='AttentionScore', data=df, color='lightblue', label='Attention Score (%)')
-
-# Overlay a dot chart to indicate success (right/wrong)
-sns.stripplot(x='TopicName', y=[5 if correct else 5 for correct in df['IsCorrect']], 
-              hue=df['IsCorrect'].map({1: 'Correct Answer', 0: 'Incorrect Answer'}),
-              palette={'Correct Answer': 'green', 'Incorrect Answer': 'red'},
-              data=df, s=15, jitter=False, ax=ax, linewidth=1, edgecolor='black')
-
-plt.title('Attention Score and Answer Correctness per Topic', fontsize=16)
-plt.xlabel('Topic', fontsize=12)
-plt.ylabel('Attention Score (%)', fontsize=12)
-plt.xticks(rotation=25, ha='right')
-plt.ylim(0, 110)
-plt.legend(title='Outcome')
-plt.tight_layout()
-plt.savefig(os.path.join(OUTPUT_DIR, 'attention_vs_success.png'))
-print("Graph 'attention_vs_success.png' saved in '{}'".format(OUTPUT_DIR))
-
-
-# --- GRAPH 2: TREND OF ATTENTION OVER TIME ---
-plt.figure(figsize=(12, 6))
-plt.plot(df['TopicName'], df['AttentionScore'], marker='o', linestyle='-', color='purple')
-plt.title('Attention Trend Throughout the Lesson', fontsize=16)
-plt.xlabel('Topic Sequence', fontsize=12)
-plt.ylabel('Attention Score (%)', fontsize=12)
-plt.xticks(rotation=25, ha='right')
-plt.ylim(0, 105)
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(os.path.join(OUTPUT_DIR, 'attention_trend.png'))
-print("Grafico 'attention_trend.png' salvato in '{}'".format(OUTPUT_DIR))
-
-
-# --- GRAPH 3: GENERAL SUMMARY (PIE) ---
-correct_count = df['IsCorrect'].sum()
-incorrect_count = len(df) - correct_count
-
-if correct_count > 0 or incorrect_count > 0:
-    plt.figure(figsize=(8, 8))
-    plt.pie([correct_count, incorrect_count], labels=['Correct Answers', 'Incorrect Answers'], 
+def plot_attention_trend(tables):
+    import matplotlib.pyplot as plt
+    trend = tables['trend']
+    fig = plt.figure(figsize=(12, 6))
+    plt.plot(range(len(trend)), trend['attention'], marker='o', linestyle='-', color='purple')
+    plt.title('Attention Trend Throughout the Lesson', fontsize=16)
+    plt.xlabel('Topic Sequence (last {} answers)'.format(TREND_ROWS), fontsize=12)
+    plt.ylabel('Attention Score (%)', fontsize=12)
+    # one topic name every `step` answers, so the labels stay readable
+    step = max(1, -(-len(trend) // MAX_BARS))
+    plt.xticks(range(0, len(trend), step), trend['TopicName'].iloc[::step], rotation=25, ha='right')
+    plt.ylim(0, 105)
+    plt.grid(True)
+    plt.tight_layout()
+    return fig
+
+
+def plot_overall_performance(tables):
+    import matplotlib.pyplot as plt
+    correct_count = tables['topics']['correct'].sum()
+    incorrect_count = tables['topics']['answers'].sum() - correct_count
+    fig = plt.figure(figsize=(8, 8))
+    plt.pie([correct_count, incorrect_count], labels=['Correct Answers', 'Incorrect Answers'],
             autopct='%1.1f%%', startangle=90, colors=['#4CAF50', '#F44336'])
     plt.title('Overall Quiz Performance', fontsize=16)
-    plt.savefig(os.path.join(OUTPUT_DIR, 'overall_performance.png'))
-    print("Graph 'overall_performance.png' saved in '{}'".format(OUTPUT_DIR))
-else:
-    print("No data to generate the graph 'overall_performance.png'.")
-
-try:
-    plt.show()
-except Exception as e:
-    print("\nUnable to show graphs on screen (it may be an environment without a graphical user interface). The files have been saved.")
-    print("Error: {}".format(e))
\ No newline at end of file
+    return fig
+
+
+def _plot_breakdown(table, label, title):
+    import matplotlib.pyplot as plt
+    data = table[['attention', 'success']].rename(
+        columns={'attention': 'Attention Score (%)', 'success': 'Correct Answers (%)'})
+    fig, ax = plt.subplots(figsize=(min(24, max(8, 0.6 * len(data) + 4)), 6))
+    if len(data) <= MAX_BARS:
+        data.plot.bar(ax=ax, color=['lightblue', '#4CAF50'], edgecolor='black')
+    else:
+        # Too many keys for readable bars (e.g. months of sessions): one line each
+        data.reset_index(drop=True).plot(ax=ax, color=['steelblue', '#4CAF50'], marker='.')
+    ax.set_title(title, fontsize=16)
+    ax.set_xlabel(label, fontsize=12)
+    ax.set_ylabel('%', fontsize=12)
+    ax.set_ylim(0, 110)
+    plt.xticks(rotation=25, ha='right')
+    plt.tight_layout()
+    return fig
+
+
+def plot_per_session(tables):
+    return _plot_breakdown(tables['sessions'], 'Session', 'Attention and Success per Session')
+
+
+def plot_per_subject(tables):
+    return _plot_breakdown(tables['subjects'], 'Subject', 'Attention and Success per Subject')
+
+
+# file name -> figure function
+FIGURES = {
+    'attention_vs_success.png': plot_attention_vs_success,
+    'attention_trend.png': plot_attention_trend,
+    'overall_performance.png': plot_overall_performance,
+    'per_session.png': plot_per_session,
+    'per_subject.png': plot_per_subject,
+}
+
+# file name -> the aggregates the figure is drawn from
+FIGURE_INPUTS = {
+    'attention_vs_success.png': lambda t: t['topics'][['attention', 'success']],
+    'attention_trend.png': lambda t: t['trend'],
+    'overall_performance.png': lambda t: t['topics'][['correct', 'answers']].sum(),
+    'per_session.png': lambda t: t['sessions'][['attention', 'success']],
+    'per_subject.png': lambda t: t['subjects'][['attention', 'success']],
+}
+
+
+def fingerprint(data):
+    hashed = pd.util.hash_pandas_object(data, index=True).values.tobytes()
+    return hashlib.blake2b(hashed, digest_size=16).hexdigest()
+
+
+def stale_figures(tables, rendered, output_dir):
+    # Figures whose inputs changed since they were drawn, or whose file is gone.
+    # Returns {file name: fingerprint of its inputs}
+    stale = {}
+    for name in FIGURES:
+        digest = fingerprint(FIGURE_INPUTS[name](tables))
+        if rendered.get(name) != digest or not os.path.exists(os.path.join(output_dir, name)):
+            stale[name] = digest
+    return stale
+
+
+def init_worker():
+    # Headless rendering in batch workers
+    import matplotlib
+    matplotlib.use('Agg')
+    import seaborn as sns
+    sns.set_style("whitegrid")
+
+
+def render(name, tables, output_dir, close=True):
+    import matplotlib.pyplot as plt
+    fig = FIGURES[name](tables)
+    fig.savefig(os.path.join(output_dir, name))
+    if close:
+        plt.close(fig)
+    return name
+
+
+def render_all(tables, output_dir, workers, names):
+    # Batch mode: one figure per task, rendered by `workers` processes on Agg
+    with ProcessPoolExecutor(max_workers=min(workers, len(names)), initializer=init_worker) as pool:
+        futures = [pool.submit(render, name, tables, output_dir) for name in names]
+        for future in futures:
+            print("Graph '{}' saved in '{}'".format(future.result(), output_dir))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Graphs of the sessions logged in benchmark_log.csv.")
+    parser.add_argument('--log', default=LOG_FILE_PATH, help="benchmark log to read")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--batch', action='store_true',
+                        help="headless mode: render the figures in parallel worker processes, no window")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help="rendering processes in batch mode")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help="log rows aggregated at a time")
+    parser.add_argument('--full', action='store_true',
+                        help="ignore the aggregate store: read the whole log and redraw every figure")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.log):
+        print("ERRORE: File not found in '{}'".format(args.log))
+        return
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    store_path = os.path.join(args.output_dir, STORE_FILE)
+    store, new_bytes = update_store(store_path, args.log, args.chunk_rows, rebuild=args.full)
+    tables = finish(store['tables'])
+    if tables is None:
+        print("WARNING: The log file '{}' is empty. Unable to generate graphs.".format(args.log))
+        return
+
+    print("{} answers, {} topics, {} sessions, {} subjects ({} new bytes read)".format(
+        tables['topics']['answers'].sum(), len(tables['topics']),
+        len(tables['sessions']), len(tables['subjects']), new_bytes))
+
+    stale = stale_figures(tables, {} if args.full else store['figures'], args.output_dir)
+    if not stale:
+        print("All graphs in '{}' are up to date.".format(args.output_dir))
+        return
+
+    if args.batch:
+        render_all(tables, args.output_dir, args.workers, list(stale))
+    else:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        sns.set_style("whitegrid")
+        for name in stale:
+            render(name, tables, args.output_dir, close=False)
+            print("Graph '{}' saved in '{}'".format(name, args.output_dir))
+
+    store['figures'].update(stale)
+    save_store(store_path, store)
+    if args.batch:
+        return
+
+    try:
+        plt.show()
+    except Exception as e:
+        print("\nUnable to show graphs on screen (it may be an environment without a graphical user interface). The files have been saved.")
+        print("Error: {}".format(e))
+
+
+if __name__ == '__main__':
+    main()
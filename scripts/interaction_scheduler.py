@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Event-driven pacing of speech, gestures and tablet updates.
+
+A lesson step is "show Z, say X, do gesture Y, then continue": the speech
+and the gesture run in parallel threads and the step ends when both have
+really finished (blocking TTS call / animation returning, or a qi.Future
+being done), instead of after a fixed time.sleep. `hold` keeps a screen
+up for a minimum time when the student has to read it.
+
+All waits go through a Clock, so the pacing can be driven by a virtual
+clock in tests and replays. Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import threading
+import time
+
+
+class Clock(object):
+    # Wall clock. Replays can swap in a virtual clock with the same methods.
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        return event.wait(timeout)
+
+
+def _wait_result(result):
+    # qi.Future-like results (async NAOqi calls) are finished when wait() returns
+    if result is not None and hasattr(result, 'wait'):
+        result.wait()
+
+
+class Scheduler(object):
+
+    def __init__(self, say=None, gesture=None, clock=None, gap=0.3, step_timeout=30.0, tracer=None):
+        # say(text) and gesture(key) must block until the action is finished
+        self._say = say
+        self._gesture = gesture
+        self.clock = clock or Clock()
+        self.tracer = tracer                # optional session_trace.Tracer
+        self.gap = gap                      # pause between two steps
+        self.step_timeout = step_timeout    # never wait longer than this on one step
+
+    def _trace(self, name, start, **tags):
+        if self.tracer is not None and name:
+            self.tracer.record(name, start, self.clock.time(), **tags)
+
+    def _start(self, span, fn, *args):
+        done = threading.Event()
+
+        def _run():
+            start = self.clock.time()
+            try:
+                _wait_result(fn(*args))
+            except Exception as e:
+                print("WARNING: scheduled action failed:", e)
+            finally:
+                self._trace(span, start)
+                done.set()
+
+        t = threading.Thread(target=_run)
+        t.daemon = True
+        t.start()
+        return done
+
+    def step(self, show=None, say=None, gesture=None, hold=0.0, timeout=None, name=None, action=None):
+        # Run show() in the caller's thread (MODIM calls stay on one thread)
+        # while `say` and `gesture` play, wait for all of them, then keep the
+        # step on screen until `hold` seconds from its start. Returns the
+        # duration of the step in seconds. With a tracer, the step and its
+        # parts are recorded as `name`, `name.show`, `name.say`, ...
+        start = self.clock.time()
+        sub = (lambda part: "%s.%s" % (name, part)) if name else (lambda part: None)
+        pending = []
+        if say and self._say:
+            pending.append(self._start(sub("say"), self._say, say))
+        if gesture and self._gesture:
+            pending.append(self._start(sub("gesture"), self._gesture, gesture))
+        if show:
+            show_start = self.clock.time()
+            show()
+            self._trace(sub("show"), show_start, action=action)
+
+        limit = self.step_timeout if timeout is None else timeout
+        for done in pending:
+            remaining = limit - (self.clock.time() - start)
+            if remaining <= 0 or not self.clock.wait(done, remaining):
+                print("WARNING: step still running after %.1f s, continuing" % limit)
+                break
+
+        elapsed = self.clock.time() - start
+        hold_start = self.clock.time()
+        self.clock.sleep(max(self.gap, hold - elapsed))
+        self._trace(sub("hold"), hold_start)
+        self._trace(name, start, action=action)
+        return self.clock.time() - start
+
+    def pause(self, seconds, name=None):
+        start = self.clock.time()
+        self.clock.sleep(seconds)
+        self._trace(name, start)
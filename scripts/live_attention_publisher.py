@@ -0,0 +1,96 @@
+import argparse
+import socket
+import time
+
+import cv2
+import numpy as np
+
+import offline_labeler_with_eye_tracking as labeler
+from attention_smoothing import StreamingSmoother
+from attention_stream import DEFAULT_HOST, DEFAULT_PORT, encode_label
+
+
+# ---------------------
+# Live capture and labeling
+# ---------------------
+# Grabs frames from a camera, labels them with the same models and
+# thresholds as the offline labeler, smooths them and publishes every
+# label with its capture timestamp to pepper_interaction.py
+# (ATTENTION_SOURCE=live) over a local UDP socket.
+
+def label_live_frame(img, thresholds, tracker=None):
+    # ATTENTIVE / DISTRACTED for one camera frame
+    _, eye_pts, _ = labeler.detect_eyes(img, tracker)
+    if eye_pts is None:
+        return 'DISTRACTED'
+    positions = labeler.eye_positions(eye_pts[None])
+    return 'ATTENTIVE' if labeler.attentive_mask(positions, *thresholds)[0] else 'DISTRACTED'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Publish live attention labels from a camera.")
+    parser.add_argument('--camera', default='0',
+                        help="camera index or video file/stream URL (default: %(default)s)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--thresholds', type=float, nargs=4, default=list(labeler.THRESHOLDS),
+                        metavar=('X_LEFT', 'X_RIGHT', 'Y_UP', 'Y_DOWN'))
+    parser.add_argument('--window', type=int, default=5,
+                        help="smoothing window in frames, adds window // 2 frames of lag (default: %(default)s)")
+    parser.add_argument('--min-coverage', type=int, default=None)
+    parser.add_argument('--track', action='store_true',
+                        help="follow the face from frame to frame, the detector runs only when it is lost")
+    parser.add_argument('--stats-every', type=int, default=300,
+                        help="print latency statistics every N frames (default: %(default)s)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    camera = int(args.camera) if args.camera.isdigit() else args.camera
+    cap = cv2.VideoCapture(camera)
+    if not cap.isOpened():
+        raise SystemExit(f"ERROR: unable to open camera '{args.camera}'")
+
+    labeler.load_models()
+    smoother = StreamingSmoother(args.window, args.min_coverage)
+    tracker = labeler.FaceTracker() if args.track else None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = (args.host, args.port)
+    print(f"INFO: Publishing attention labels to {args.host}:{args.port} (Ctrl+C to stop)")
+
+    seq = 0
+    latencies = []
+    try:
+        while True:
+            ok, img = cap.read()
+            t_capture = time.time()
+            if not ok:
+                break
+            status = label_live_frame(img, args.thresholds, tracker)
+            # Each label keeps the capture time of its own frame, so the
+            # smoothing lag shows up in the measured latency
+            for t_frame, label in smoother.push(t_capture, status):
+                sock.sendto(encode_label(t_frame, seq, label), target)
+                latencies.append(time.time() - t_frame)
+                seq += 1
+
+            if args.stats_every and len(latencies) >= args.stats_every:
+                lat = np.array(latencies) * 1000.0
+                print(f"INFO: {seq} labels sent, capture->publish latency "
+                      f"mean={lat.mean():.1f} ms p95={np.percentile(lat, 95):.1f} ms max={lat.max():.1f} ms"
+                      + (f", {tracker.detections} face detections" if tracker else ""))
+                latencies = []
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for t_frame, label in smoother.flush():
+            sock.sendto(encode_label(t_frame, seq, label), target)
+            seq += 1
+        cap.release()
+        labeler.close_models()
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+One shared NAOqi connection per robot, with lazy services and reconnect.
+
+NaoqiSession opens a single qi.Session on first use and fetches services
+(ALTextToSpeech, ALAnimationPlayer, ALTabletService, ...) only when they
+are first needed, caching them afterwards. A call that fails because the
+connection dropped reconnects and is retried once.
+
+With PEPPER_FAKE_NAOQI=1 (or fake=True) the session is created by
+fake_naoqi instead of qi, so everything runs off-robot.
+
+Imported by the MODIM interaction code, so it stays compatible with
+Python 2.7.
+"""
+from __future__ import print_function
+
+import os
+import threading
+
+
+def _qi_session():
+    import qi
+    return qi.Session()
+
+
+def _fake_session():
+    import fake_naoqi
+    return fake_naoqi.Session()
+
+
+class NaoqiSession(object):
+
+    def __init__(self, ip, port, session_factory=None, max_retries=1):
+        self.url = "tcp://%s:%d" % (ip, port)
+        self._factory = session_factory or _qi_session
+        self._max_retries = max_retries
+        self._session = None
+        self._services = {}
+        self._lock = threading.RLock()
+        self.connect_count = 0
+
+    def _connect(self):
+        session = self._factory()
+        session.connect(self.url)
+        self._session = session
+        self._services = {}
+        self.connect_count += 1
+        print("INFO: NAOqi session connected to %s" % self.url)
+
+    def _is_connected(self):
+        if self._session is None:
+            return False
+        try:
+            return self._session.isConnected()
+        except Exception:
+            return False
+
+    def session(self):
+        # The underlying qi.Session, connected (again) if needed
+        with self._lock:
+            if not self._is_connected():
+                self._connect()
+            return self._session
+
+    def available(self):
+        # True if the robot can be reached, without raising
+        try:
+            self.session()
+            return True
+        except Exception as e:
+            print("WARNING: NAOqi not reachable at %s: %s" % (self.url, e))
+            return False
+
+    def raw_service(self, name):
+        # Real service object, fetched once per connection
+        with self._lock:
+            session = self.session()
+            if name not in self._services:
+                self._services[name] = session.service(name)
+            return self._services[name]
+
+    def service(self, name):
+        # Proxy that survives reconnections: every call goes through call()
+        return ServiceRef(self, name)
+
+    def call(self, name, path, *args, **kwargs):
+        # Call service `name` attribute path (e.g. ('say',) or ('post', 'run')),
+        # reconnecting and retrying when the connection dropped
+        attempt = 0
+        while True:
+            target = self.raw_service(name)
+            for attr in path:
+                target = getattr(target, attr)
+            try:
+                return target(*args, **kwargs)
+            except Exception:
+                if attempt >= self._max_retries or self._is_connected():
+                    raise
+                attempt += 1
+                print("WARNING: NAOqi connection lost calling %s.%s, reconnecting" % (name, '.'.join(path)))
+                with self._lock:
+                    self._session = None
+                    self._services = {}
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                try:
+                    self._session.close()
+                except Exception:
+                    pass
+            self._session = None
+            self._services = {}
+
+
+class ServiceRef(object):
+    # Lazy reference to a service method: tts.say(...), anim.post.run(...)
+
+    def __init__(self, manager, name, path=()):
+        self._manager = manager
+        self._name = name
+        self._path = path
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return ServiceRef(self._manager, self._name, self._path + (attr,))
+
+    def __call__(self, *args, **kwargs):
+        return self._manager.call(self._name, self._path, *args, **kwargs)
+
+
+# One manager per robot for the whole process, shared by every interaction run
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_session(ip, port, fake=None):
+    if fake is None:
+        fake = os.environ.get('PEPPER_FAKE_NAOQI', '0') == '1'
+    key = (ip, port, fake)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = NaoqiSession(ip, port, _fake_session if fake else _qi_session)
+        return _shared[key]
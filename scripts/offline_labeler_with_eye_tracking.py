@@ -3,7 +3,15 @@ import mediapipe as mp
 import numpy as np
 import os
 import csv
-import math 
+import math
+import argparse
+import multiprocessing
+from collections import namedtuple, deque
+
+from attention_binlog import AttentionLogWriter
+from attention_smoothing import smooth_stream
+from frame_feature_cache import FeatureCache, settings_key, source_id
+from frame_prefetch import PrefetchStats, decode_image, load_frame, prefetch_frames
 
 
 # ---------------------
@@ -15,222 +23,660 @@ X_LEFT_THRESH  = 0.30
 X_RIGHT_THRESH = 0.70
 Y_UP_THRESH    = 0.30
 Y_DOWN_THRESH  = 0.70
+THRESHOLDS = (X_LEFT_THRESH, X_RIGHT_THRESH, Y_UP_THRESH, Y_DOWN_THRESH)
 
 # Path of images
 FOLDER_PATH = r'PATH_TO_DATASET'
 
+# Number of worker processes used for labeling (0 = label in the main process)
+NUM_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+# Consecutive frames sent to a worker in one task
+CHUNK_SIZE = 32
+# Frames read ahead of the inference, and threads reading them
+PREFETCH_DEPTH   = 64
+PREFETCH_THREADS = 8
+
+# The face crop is upscaled (cubic) until its longest side reaches
+# FACE_TARGET_SIZE pixels, by at most MAX_UPSCALE; larger faces are used as is
+FACE_TARGET_SIZE = 384
+MAX_UPSCALE      = 4.0
+# Version of the cached features, increase it when their computation changes
+FEATURE_VERSION  = 2
+# Tracking mode: frames located from the face of the previous frame before
+# the detector runs again on the full frame
+TRACK_MAX_FRAMES = 30
+
 # ---------------------
 # Setup MediaPipe
 # ---------------------
 mp_face_mesh   = mp.solutions.face_mesh
 mp_face_detect = mp.solutions.face_detection
 
+# The models are created once per process (main process or pool worker)
+# and reused for every frame, instead of being reloaded for each image.
+_face_detector = None
+_face_mesh     = None
+# Read-only view of the feature cache in this process (None = no cache)
+_feature_cache = None
+# Images are decoded at 1/_decode_scale of their resolution in this process
+_decode_scale = 1
+
+# Landmarks used for the eye geometry. For each eye (left, right):
+# 4 iris points, 2 eye corners, top and bottom eyelid.
+EYE_LANDMARKS = np.array([[469, 470, 471, 472,  33, 133, 159, 145],
+                          [474, 475, 476, 477, 362, 263, 386, 374]])
+EYE_LANDMARKS_FLAT = EYE_LANDMARKS.ravel().tolist()
+
+# Expensive per-frame results: face bbox in the frame and (2, 2) normalized
+# iris positions, None when no face / no landmarks are found.
+# `face` is only kept for the on-screen preview.
+FrameFeatures = namedtuple('FrameFeatures', ['fname', 'key', 'bbox', 'positions', 'face'])
+# Result of labeling one frame.
+FrameLabel = namedtuple('FrameLabel', ['fname', 'status', 'left_norm', 'right_norm', 'face'])
+
 # ---------------------
 # Functions of utilities
 # ---------------------
+def load_models():
+    # Load the MediaPipe models for this process (no-op if already loaded)
+    global _face_detector, _face_mesh
+    if _face_detector is None:
+        _face_detector = mp_face_detect.FaceDetection(model_selection=1,
+                                                      min_detection_confidence=0.5)
+    if _face_mesh is None:
+        _face_mesh = mp_face_mesh.FaceMesh(static_image_mode=True,
+                                           max_num_faces=1,
+                                           refine_landmarks=True,
+                                           min_detection_confidence=0.5)
+    return _face_detector, _face_mesh
+
+
+def init_worker(cache_path=None, decode_scale=1):
+    # Pool initializer: models and cache are opened once per worker
+    global _feature_cache, _decode_scale
+    load_models()
+    _decode_scale = decode_scale
+    if cache_path:
+        _feature_cache = FeatureCache(cache_path, readonly=True)
+
+
+def close_models():
+    # Release the MediaPipe models of this process
+    global _face_detector, _face_mesh
+    if _face_detector is not None:
+        _face_detector.close()
+        _face_detector = None
+    if _face_mesh is not None:
+        _face_mesh.close()
+        _face_mesh = None
+
+
+def get_face_bbox(img):
+    # Area around the face as (x1, y1, x2, y2) pixels
+    detector, _ = load_models()
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    res = detector.process(rgb)
+    if not res.detections:
+        return None
+    bbox = res.detections[0].location_data.relative_bounding_box
+    h, w, _ = img.shape
+    x1 = max(int(bbox.xmin * w) - 20, 0)
+    y1 = max(int(bbox.ymin * h) - 20, 0)
+    x2 = min(x1 + int(bbox.width * w) + 40, w)
+    y2 = min(y1 + int(bbox.height * h) + 40, h)
+    return x1, y1, x2, y2
+
+
 def get_face_crop(img):
     # Trim the area around the face
-    with mp_face_detect.FaceDetection(model_selection=1,
-                                     min_detection_confidence=0.5) as detector:
-        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        res = detector.process(rgb)
-        if not res.detections:
-            return None
-        bbox = res.detections[0].location_data.relative_bounding_box
-        h, w, _ = img.shape
-        x1 = max(int(bbox.xmin * w) - 20, 0)
-        y1 = max(int(bbox.ymin * h) - 20, 0)
-        x2 = min(x1 + int(bbox.width * w) + 40, w)
-        y2 = min(y1 + int(bbox.height * h) + 40, h)
-        return img[y1:y2, x1:x2]
+    bbox = get_face_bbox(img)
+    if bbox is None:
+        return None
+    x1, y1, x2, y2 = bbox
+    return img[y1:y2, x1:x2]
 
 
 def get_landmarks(img):
     # Return to the Face Mesh landmarks
-    with mp_face_mesh.FaceMesh(static_image_mode=True,
-                               max_num_faces=1,
-                               refine_landmarks=True,
-                               min_detection_confidence=0.5) as fmesh:
-        img.flags.writeable = False
-        res = fmesh.process(img)
-        if not res.multi_face_landmarks:
+    _, fmesh = load_models()
+    img.flags.writeable = False
+    res = fmesh.process(img)
+    if not res.multi_face_landmarks:
+        return None
+    return res.multi_face_landmarks[0].landmark
+
+
+def landmarks_to_array(landmarks, w, h):
+    # Pixel coordinates of the eye landmarks of one frame, shape (2 eyes, 8 points, xy)
+    pts = np.array([(landmarks[i].x, landmarks[i].y) for i in EYE_LANDMARKS_FLAT])
+    return (pts * (w, h)).reshape(EYE_LANDMARKS.shape + (2,))
+
+
+def eye_positions(eyes):
+    # Normalized position of each iris inside its eye bbox, for a batch of
+    # frames: (N, 2, 8, 2) eye landmarks -> (N, 2, 2) as (nx, ny) per eye
+    iris = eyes[:, :, :4].mean(axis=2)
+    corner_x = eyes[:, :, 4:6, 0]
+    bbox_y   = eyes[:, :, 4:8, 1]
+    xmin, xmax = corner_x.min(axis=2), corner_x.max(axis=2)
+    ymin, ymax = bbox_y.min(axis=2), bbox_y.max(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nx = (iris[..., 0] - xmin) / (xmax - xmin)
+        ny = (iris[..., 1] - ymin) / (ymax - ymin)
+    return np.stack([nx, ny], axis=-1)
+
+
+def attentive_mask(positions, x_left=X_LEFT_THRESH, x_right=X_RIGHT_THRESH,
+                   y_up=Y_UP_THRESH, y_down=Y_DOWN_THRESH):
+    # ATTENTIVE if both irises are in the X and Y range, for a (N, 2, 2) batch
+    nx, ny = positions[..., 0], positions[..., 1]
+    centered = (x_left <= nx) & (nx <= x_right) & (y_up <= ny) & (ny <= y_down)
+    return centered.all(axis=1)
+
+
+def upscale_face(crop, target=FACE_TARGET_SIZE, max_factor=MAX_UPSCALE):
+    # Enlarge a small face crop for precise eyes; crops already large
+    # enough are only copied (Face Mesh needs contiguous images)
+    h, w = crop.shape[:2]
+    factor = min(max_factor, float(target) / max(h, w, 1))
+    if factor <= 1.0:
+        return np.ascontiguousarray(crop)
+    return cv2.resize(crop, (int(round(w * factor)), int(round(h * factor))),
+                      interpolation=cv2.INTER_CUBIC)
+
+
+def landmark_box(landmarks):
+    # Normalized (x1, y1, x2, y2) extent of all the Face Mesh landmarks
+    xs = [p.x for p in landmarks]
+    ys = [p.y for p in landmarks]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+class FaceTracker:
+    # Face box of the previous frame of a sequence. On a fixed camera the
+    # face barely moves, so Face Mesh is run on the previous box and the
+    # detector only when the landmarks are lost or reach the crop border.
+
+    def __init__(self, max_frames=TRACK_MAX_FRAMES, border=0.03, min_fill=0.25):
+        self.max_frames = max_frames    # frames tracked before a forced re-detection
+        self.border = border            # landmarks closer to the crop edge = face leaving the box
+        self.min_fill = min_fill        # landmarks covering less of the crop = box too loose
+        self.bbox = None
+        self.tracked = 0
+        self.detections = 0
+
+    def current(self, shape):
+        # Box to try on the next frame (clamped to it), None when the detector must run
+        if self.bbox is None or self.tracked >= self.max_frames:
             return None
-        return res.multi_face_landmarks[0].landmark
+        h, w = shape[:2]
+        x1, y1, x2, y2 = self.bbox
+        x2, y2 = min(x2, w), min(y2, h)
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+        return x1, y1, x2, y2
 
+    def confident(self, landmarks):
+        x1, y1, x2, y2 = landmark_box(landmarks)
+        return (min(x1, y1) > self.border and max(x2, y2) < 1 - self.border
+                and (x2 - x1) * (y2 - y1) >= self.min_fill)
 
-def iris_center(landmarks, indices, w, h):
-    # Calculate the iris center
-    xs = [landmarks[i].x * w for i in indices]
-    ys = [landmarks[i].y * h for i in indices]
-    return np.mean(xs), np.mean(ys)
+    def update(self, bbox, landmarks, shape):
+        # Next box: the landmark extent in the frame, with the detector's margins
+        x1, y1, x2, y2 = bbox
+        lx1, ly1, lx2, ly2 = landmark_box(landmarks)
+        w, h = x2 - x1, y2 - y1
+        fh, fw = shape[:2]
+        self.bbox = (max(int(x1 + lx1 * w) - 20, 0), max(int(y1 + ly1 * h) - 20, 0),
+                     min(int(x1 + lx2 * w) + 20, fw), min(int(y1 + ly2 * h) + 20, fh))
+        self.tracked += 1
 
+    def detected(self, bbox):
+        self.bbox = bbox
+        self.tracked = 0
+        self.detections += 1
 
-def eye_bbox_norm(landmarks, corner_idxs, topbot_idxs, iris_cent, w, h):
-    # Normalizes the position of the iris within the eye bbox
-    corner_x = [landmarks[i].x * w for i in corner_idxs]
-    corner_y = [landmarks[i].y * h for i in corner_idxs]
-    topbot_y = [landmarks[i].y * h for i in topbot_idxs]
-    xmin, xmax = min(corner_x), max(corner_x)
-    ymin, ymax = min(min(corner_y), min(topbot_y)), max(max(corner_y), max(topbot_y))
-    ix, iy = iris_cent
-    nx = (ix - xmin) / (xmax - xmin)
-    ny = (iy - ymin) / (ymax - ymin)
-    return nx, ny
 
-# ---------------------
-# Main Processing
-# ---------------------
-frame_list = sorted([f for f in os.listdir(FOLDER_PATH)
-                     if f.lower().endswith(('.jpg', '.png'))])
-results = []
-
-for fname in frame_list:
-    img_path = os.path.join(FOLDER_PATH, fname)
-    img = cv2.imread(img_path)
-    if img is None:
-        continue
-
-    face = get_face_crop(img)
-    if face is None:
-        results.append((fname, 'DISTRACTED'))
-        continue
-
-    # Upscale to increase the value for precise eyes.
-    face = cv2.resize(face, None, fx=4, fy=4, interpolation=cv2.INTER_CUBIC)
+def detect_eyes(img, tracker=None):
+    # Run the models on one BGR frame: (face bbox, eye landmarks array, upscaled face),
+    # the bbox / array are None when no face / no landmarks are found.
+    # With a FaceTracker, the face box of the previous frame is tried first.
+    bbox = tracker.current(img.shape) if tracker is not None else None
+    if bbox is not None:
+        x1, y1, x2, y2 = bbox
+        face = upscale_face(img[y1:y2, x1:x2])
+        lm = get_landmarks(face)
+        if lm is not None and tracker.confident(lm):
+            h, w, _ = face.shape
+            tracker.update(bbox, lm, img.shape)
+            return bbox, landmarks_to_array(lm, w, h), face
+
+    bbox = get_face_bbox(img)
+    if tracker is not None:
+        tracker.detected(bbox)
+    if bbox is None:
+        return None, None, None
+    x1, y1, x2, y2 = bbox
+
+    # Upscale small faces to increase the value for precise eyes.
+    face = upscale_face(img[y1:y2, x1:x2])
     h, w, _ = face.shape
     lm = get_landmarks(face)
     if lm is None:
-        results.append((fname, 'DISTRACTED'))
-        continue
-
-    # Calculate iris centers and normalize for eye
-    left_idx  = [469, 470, 471, 472]
-    right_idx = [474, 475, 476, 477]
-    left_center  = iris_center(lm, left_idx, w, h)
-    right_center = iris_center(lm, right_idx, w, h)
-    left_norm  = eye_bbox_norm(lm, [33,133],  [159,145], left_center,  w, h)
-    right_norm = eye_bbox_norm(lm, [362,263], [386,374], right_center, w, h)
-
-    # Check eye direction based only on eyes
-    lx, ly = left_norm
-    rx, ry = right_norm
-    # ATTENTIVE if both irises are in the X and Y range
-    if (X_LEFT_THRESH  <= lx <= X_RIGHT_THRESH and
-        X_LEFT_THRESH  <= rx <= X_RIGHT_THRESH and
-        Y_UP_THRESH    <= ly <= Y_DOWN_THRESH    and
-        Y_UP_THRESH    <= ry <= Y_DOWN_THRESH):
-        status = 'ATTENTIVE'
-    else:
-        status = 'DISTRACTED'
+        return bbox, None, face
+    return bbox, landmarks_to_array(lm, w, h), face
 
-    # Debug: print normalized values and status
-    print(f"DEBUG {fname}: left={left_norm}, right={right_norm}, status={status}")
 
-    # Annotation and display
-    face.flags.writeable = True
-    color = (0,255,0) if status=='ATTENTIVE' else (0,0,255)
-    cv2.putText(face, f"Attention: {status}", (30,30),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-    cv2.imshow('Frame', face)
-    if cv2.waitKey(0) == 27:
-        break
+def feature_settings(track=False):
+    # Tag of the settings the features depend on, part of their cache key
+    return f"v{FEATURE_VERSION} face={FACE_TARGET_SIZE} upscale={MAX_UPSCALE:g} track={int(bool(track))}"
+
+
+def read_frame(frame):
+    # A frame is an image path, a (name, image) pair decoded from a video, or
+    # a (name, key, data) triple already loaded by the prefetch stage.
+    # Returns (name, content hash, data to decode or decoded image).
+    if isinstance(frame, tuple) and len(frame) == 3:
+        return frame
+    return load_frame(frame, _decode_scale, decode=False)
+
+
+def extract_chunk(frames, keep_face=False, track=False):
+    # Worker task: compute the features of a run of consecutive frames.
+    # Frames found in the cache are not decoded, the others run through the
+    # models frame by frame and the eye geometry is computed for the whole
+    # chunk at once. Unreadable images are skipped. With `track`, the face
+    # is followed from frame to frame inside the chunk (chunks go to
+    # different workers, so each one starts with a detection).
+    settings = feature_settings(track)
+    items = [(fname, settings_key(key, settings), data) for fname, key, data in map(read_frame, frames)]
+    cached = _feature_cache.get_many([key for _, key, _ in items]) if _feature_cache else {}
+    tracker = FaceTracker() if track else None
+
+    features, eyes = [], []
+    for fname, key, data in items:
+        if key in cached:
+            bbox, positions = cached[key]
+            features.append(FrameFeatures(fname, key, bbox, positions, None))
+            eyes.append(None)
+            continue
+        img = data if data is None or data.ndim == 3 else decode_image(data, _decode_scale)
+        if img is None:
+            continue
+        bbox, eye_pts, face = detect_eyes(img, tracker)
+        features.append(FrameFeatures(fname, key, bbox, None,
+                                      face if keep_face and eye_pts is not None else None))
+        eyes.append(eye_pts)
+
+    found = [i for i, e in enumerate(eyes) if e is not None]
+    if found:
+        positions = eye_positions(np.stack([eyes[i] for i in found]))
+        for k, i in enumerate(found):
+            features[i] = features[i]._replace(positions=positions[k])
+    return features
+
+
+def classify_features(features, thresholds=THRESHOLDS):
+    # Turn a chunk of FrameFeatures into FrameLabels with the given
+    # (x_left, x_right, y_up, y_down) thresholds
+    found = [i for i, feat in enumerate(features) if feat.positions is not None]
+    attentive = []
+    if found:
+        attentive = attentive_mask(np.stack([features[i].positions for i in found]), *thresholds)
+
+    labels = [FrameLabel(feat.fname, 'DISTRACTED', None, None, None) for feat in features]
+    for k, i in enumerate(found):
+        feat = features[i]
+        status = 'ATTENTIVE' if attentive[k] else 'DISTRACTED'
+        left_norm, right_norm = (tuple(p) for p in feat.positions.tolist())
+        labels[i] = FrameLabel(feat.fname, status, left_norm, right_norm, feat.face)
+    return labels
+
+
+def iter_chunks(frames, chunk_size):
+    # Group an iterable of frames in lists of chunk_size consecutive frames
+    chunk = []
+    for frame in frames:
+        chunk.append(frame)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
-    results.append((fname, status))
+def extract_features(frames, workers=NUM_WORKERS, chunk_size=CHUNK_SIZE, keep_face=False,
+                     cache_path=None, track=False, decode_scale=1):
+    # Yield the FrameFeatures of every frame by chunk, always in frame order.
+    # With workers > 0 the chunks are spread over a process pool, each worker
+    # loading the models once in its initializer.
+    if workers <= 0:
+        init_worker(cache_path, decode_scale)
+        for chunk in iter_chunks(frames, chunk_size):
+            yield extract_chunk(chunk, keep_face, track)
+        close_models()
+        return
+
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(cache_path, decode_scale)) as pool:
+        # Results are collected in submission order, so smoothing sees the
+        # frames in sequence. Only a few chunks are in flight at a time, so a
+        # long video is never decoded into memory all at once.
+        pending = deque()
+        for chunk in iter_chunks(frames, chunk_size):
+            pending.append(pool.apply_async(extract_chunk, (chunk, keep_face, track)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def label_frames(frames, workers=NUM_WORKERS, chunk_size=CHUNK_SIZE, keep_face=False,
+                 thresholds=THRESHOLDS, cache=None, source=None, track=False,
+                 decode_scale=1, prefetch=PREFETCH_DEPTH, io_threads=PREFETCH_THREADS, stats=None):
+    # Yield the FrameLabel of every frame, in frame order. When a cache is
+    # given, the features of the source are saved into it as they arrive.
+    # With prefetch > 0 the frames are read ahead by io_threads threads;
+    # they are also decoded there when the main process runs the models
+    # and no cache can spare the decoding, otherwise the raw bytes go to
+    # the workers, which are cheaper to send than pixels.
+    cache_path = None
+    if cache is not None:
+        cache.clear_sequence(source, feature_settings(track))
+        cache_path = cache.path
+    if prefetch > 0:
+        frames = prefetch_frames(frames, io_threads, prefetch, decode_scale,
+                                 decode=workers <= 0 and cache is None, stats=stats)
+    num_frames = 0
+    for features in extract_features(frames, workers, chunk_size, keep_face, cache_path, track,
+                                     decode_scale):
+        if cache is not None:
+            cache.store(source, num_frames, features)
+        num_frames += len(features)
+        yield from classify_features(features, thresholds)
+
+
+def check_cached_settings(cache, source, track=False):
+    # Stop if the cached sequence of a source was labeled with other settings
+    cached, wanted = cache.sequence_settings(source), feature_settings(track)
+    if cached != wanted:
+        raise SystemExit(f"ERROR: the cached features of this source were computed with "
+                         f"'{cached or 'older settings'}', not '{wanted}' (--track as when labeled?). "
+                         f"Label it again with --cache first.")
+
+
+def relabel_from_cache(cache, source, thresholds=THRESHOLDS, chunk_size=1024):
+    # Yield the FrameLabel of a source already labeled once, using only the
+    # cached features (no image is read, no model is run)
+    x_left, x_right, y_up, y_down = thresholds
+    for names, positions in cache.iter_sequence(source, chunk_size):
+        # NaN positions (no face / no landmarks) are never centered
+        attentive = attentive_mask(positions, x_left, x_right, y_up, y_down)
+        for k, fname in enumerate(names):
+            if np.isnan(positions[k]).any():
+                yield FrameLabel(fname, 'DISTRACTED', None, None, None)
+                continue
+            status = 'ATTENTIVE' if attentive[k] else 'DISTRACTED'
+            left_norm, right_norm = (tuple(p) for p in positions[k].tolist())
+            yield FrameLabel(fname, status, left_norm, right_norm, None)
 
-cv2.destroyAllWindows()
 
 # ---------------------
-# Final smoothing (closest voting)
+# Frame sources
 # ---------------------
-window = 5
-half = window // 2
-sm = results.copy()
-for i in range(len(results)):
-    att = sum(1 for j in range(i-half, i+half+1)
-              if 0<=j<len(results) and results[j][1]=='ATTENTIVE')
-    dist = sum(1 for j in range(i-half, i+half+1)
-               if 0<=j<len(results) and results[j][1]=='DISTRACTED')
-    if att+dist >= window-1:
-        sm[i] = (results[i][0], 'ATTENTIVE' if att>dist else 'DISTRACTED')
-
-print("\n==== FINAL RESULTS AFTER SMOOTHING ====")
-for f, s in sm:
-    print(f, s)
-    
-
-# with open('labels_output.csv', 'w', newline='') as f:
-#     writer = csv.writer(f)
-#     writer.writerow(['frame', 'label'])
-#     writer.writerows(results)
-    
-    
-    
-# -----------------------------------------------
-# ### NEW LOGIC STARTS HERE ###
-# -----------------------------------------------
-
-# --- 1. Block Analysis ---
-num_frames = len(sm)
-if num_frames > 0:
+def iter_folder_frames(folder):
+    # Image paths of a folder of .jpg/.png frames, sorted by name
+    frame_list = sorted([f for f in os.listdir(folder)
+                         if f.lower().endswith(('.jpg', '.png'))])
+    for fname in frame_list:
+        yield os.path.join(folder, fname)
+
+
+def iter_video_frames(video_path):
+    # Decode the frames straight from a video file, without writing images to disk
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Unable to open video '{video_path}'")
+    try:
+        idx = 0
+        while True:
+            ok, img = cap.read()
+            if not ok:
+                break
+            yield (f"frame_{idx:04d}", img)
+            idx += 1
+    finally:
+        cap.release()
+
+
+# ---------------------
+# Smoothing and reports
+# ---------------------
+def analyse_blocks(sm, num_frames):
+    # Split the session in 3 blocks and compute the attention of each one.
+    # `sm` is an iterable of smoothed (frame, label) rows, read only once.
+    block_analysis_results = []
+    if num_frames == 0:
+        return block_analysis_results
+
     block_size = math.ceil(num_frames / 3) # Ensures we cover all frames
-    
+
     # Define the 3 blocks based on frame indices
-    block1_data = sm[0:block_size]
-    block2_data = sm[block_size : 2 * block_size]
-    block3_data = sm[2 * block_size : num_frames]
-    
-    blocks = {
-        "Block 1": block1_data,
-        "Block 2": block2_data,
-        "Block 3": block3_data
-    }
-    
-    block_analysis_results = []
-    
+    blocks = [{"block_name": f"Block {k + 1}", "total": 0, "attentive": 0,
+               "start_frame": None, "end_frame": None} for k in range(3)]
+    for idx, (fname, label) in enumerate(sm):
+        block = blocks[min(idx // block_size, 2)]
+        if block["start_frame"] is None:
+            block["start_frame"] = fname
+        block["end_frame"] = fname
+        block["total"] += 1
+        if label == 'ATTENTIVE':
+            block["attentive"] += 1
+
     print("\n==== BLOCK-LEVEL ATTENTION ANALYSIS ====")
-    for block_name, block_data in blocks.items():
-        if not block_data:
+    for block in blocks:
+        block_name = block["block_name"]
+        if block["total"] == 0:
             print(f"{block_name}: No data")
             continue
-            
-        total_in_block = len(block_data)
-        attentive_in_block = sum(1 for _, label in block_data if label == 'ATTENTIVE')
-        
-        # Calculate percentage, handle division by zero
-        attention_percentage = (attentive_in_block / total_in_block) * 100 if total_in_block > 0 else 0
-        
+
+        # Calculate percentage
+        attention_percentage = (block["attentive"] / block["total"]) * 100
+
         # Determine overall status for the block
         block_status = "ATTENTIVE" if attention_percentage >= 60.0 else "DISTRACTED"
-        
-        print(f"{block_name} (Frames {block_data[0][0]} to {block_data[-1][0]}):")
+
+        print(f"{block_name} (Frames {block['start_frame']} to {block['end_frame']}):")
         print(f"  - Attention Percentage: {attention_percentage:.2f}%")
         print(f"  - Overall Status: {block_status}")
-        
+
         block_analysis_results.append({
             "block_name": block_name,
-            "start_frame": block_data[0][0],
-            "end_frame": block_data[-1][0],
+            "start_frame": block["start_frame"],
+            "end_frame": block["end_frame"],
             "attention_percentage": f"{attention_percentage:.2f}%",
             "status": block_status
         })
+    return block_analysis_results
+
+
+def save_block_report(block_analysis_results, path='block_analysis_report.txt'):
+    # This creates a simple text file with the block summary.
+    with open(path, 'w') as f:
+        f.write("Attention Analysis by Block\n")
+        f.write("===========================\n\n")
+        for res in block_analysis_results:
+            f.write(f"{res['block_name']} (Frames {res['start_frame']} to {res['end_frame']}):\n")
+            f.write(f"  - Attention Percentage: {res['attention_percentage']}\n")
+            f.write(f"  - Status: {res['status']}\n\n")
+    print(f"\nINFO: Block analysis report saved to '{path}'")
+
+
+def save_attention_log(sm, path='attention_log.csv', binlog=None):
+    # Save the per-frame SMOOTHED results row by row as they are produced:
+    # to CSV (path, None to skip) and/or to a binary AttentionLogWriter.
+    # Returns the number of frames written.
+    num_frames = 0
+    f = open(path, 'w', newline='') if path else None
+    try:
+        writer = csv.writer(f) if f else None
+        if writer:
+            writer.writerow(['frame_filename', 'attention_label'])
+        for fname, label in sm:
+            print(fname, label)
+            if writer:
+                writer.writerow([fname, label])
+            if binlog is not None:
+                binlog.append(label)
+            num_frames += 1
+    finally:
+        if f:
+            f.close()
+        if binlog is not None:
+            binlog.close()
+    if path:
+        print(f"INFO: Per-frame smoothed attention log saved to '{path}'")
+    return num_frames
+
+
+def video_fps(video_path, default=30.0):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+    cap.release()
+    return fps or default
+
+
+# ---------------------
+# Main Processing
+# ---------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline attention labeler based on iris position.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--folder', default=FOLDER_PATH,
+                        help="folder with the .jpg/.png frames")
+    source.add_argument('--video',
+                        help="video file to decode frames from, instead of a folder")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help="labeling processes, 0 labels in the main process (default: %(default)s)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="consecutive frames per worker task (default: %(default)s)")
+    display = parser.add_mutually_exclusive_group()
+    display.add_argument('--preview', action='store_true',
+                         help="show the annotated faces while labeling, without waiting (ESC stops)")
+    display.add_argument('--step', action='store_true',
+                         help="show every annotated face and wait for a key (labels in the main process)")
+    parser.add_argument('--track', action='store_true',
+                        help="follow the face from frame to frame (fixed camera), the detector "
+                             "runs only when the face is lost")
+    parser.add_argument('--prefetch', type=int, default=PREFETCH_DEPTH,
+                        help="frames read ahead of the labeling, 0 reads them in the workers (default: %(default)s)")
+    parser.add_argument('--io-threads', type=int, default=PREFETCH_THREADS,
+                        help="threads reading the frames ahead (default: %(default)s)")
+    parser.add_argument('--decode-scale', type=int, choices=[1, 2, 4, 8], default=1,
+                        help="decode the frames at 1/N resolution, for large frames (default: %(default)s)")
+    parser.add_argument('--cache',
+                        help="SQLite file where the per-frame features are cached (e.g. features.sqlite)")
+    parser.add_argument('--from-cache', action='store_true',
+                        help="relabel a source already in --cache without reading the images")
+    parser.add_argument('--thresholds', type=float, nargs=4, default=list(THRESHOLDS),
+                        metavar=('X_LEFT', 'X_RIGHT', 'Y_UP', 'Y_DOWN'),
+                        help="iris position thresholds (default: %(default)s)")
+    parser.add_argument('--log-format', choices=['csv', 'binary', 'both'], default='csv',
+                        help="attention_log.csv, compact attention_log.atl, or both (default: %(default)s)")
+    parser.add_argument('--fps', type=float, default=None,
+                        help="frame rate stored in the binary log (default: from the video, else 30)")
+    parser.add_argument('--start-time', type=float, default=0.0,
+                        help="unix time of the first frame stored in the binary log (default: unknown)")
+    parser.add_argument('--window', type=int, default=5,
+                        help="smoothing window in frames (default: %(default)s)")
+    parser.add_argument('--min-coverage', type=int, default=None,
+                        help="frames needed in the window to relabel a frame (default: window-1)")
+    return parser.parse_args()
+
+
+def show_face(label, wait_ms):
+    # Annotation and display, returns False when ESC is pressed
+    face = label.face
+    face.flags.writeable = True
+    color = (0,255,0) if label.status=='ATTENTIVE' else (0,0,255)
+    cv2.putText(face, f"Attention: {label.status}", (30,30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+    cv2.imshow('Frame', face)
+    return cv2.waitKey(wait_ms) != 27
+
+
+def main():
+    args = parse_args()
+    source = source_id(args.video or args.folder)
+    cache = FeatureCache(args.cache) if args.cache else None
+    if args.from_cache and cache is None:
+        raise SystemExit("ERROR: --from-cache needs --cache")
+
+    # Without --preview/--step the labeler runs headless. The step-by-step
+    # mode waits for a key on every frame, so it labels in the main process.
+    show = args.preview or args.step
+    workers = 0 if args.step else args.workers
+    wait_ms = 0 if args.step else 1
+
+    prefetch_stats = PrefetchStats()
+    if args.from_cache:
+        # Only the thresholds and the smoothing are applied again
+        show = False
+        check_cached_settings(cache, source, args.track)
+        labels = relabel_from_cache(cache, source, args.thresholds)
+    else:
+        frames = iter_video_frames(args.video) if args.video else iter_folder_frames(args.folder)
+        labels = label_frames(frames, workers, args.chunk_size, show, args.thresholds,
+                              cache, source, args.track, args.decode_scale,
+                              args.prefetch, args.io_threads, prefetch_stats)
+
+    def frame_labels():
+        for label in labels:
+            if label.left_norm is not None:
+                # Debug: print normalized values and status
+                print(f"DEBUG {label.fname}: left={label.left_norm}, right={label.right_norm}, status={label.status}")
+
+            if label.face is not None and not show_face(label, wait_ms):
+                break
+
+            yield label.fname, label.status
+
+    # --- 1. Smooth the labels and save the per-frame results ---
+    # Labels are smoothed while they are produced (lag of window // 2 frames)
+    # and written straight to the logs; only the frame names and one byte
+    # per label are kept, for the block analysis.
+    print("\n==== FINAL RESULTS AFTER SMOOTHING ====")
+    frame_names, attentive = [], bytearray()
+
+    def kept(rows):
+        for fname, label in rows:
+            frame_names.append(fname)
+            attentive.append(label == 'ATTENTIVE')
+            yield fname, label
+
+    smoothed = kept(smooth_stream(frame_labels(), args.window, args.min_coverage))
+    csv_path = 'attention_log.csv' if args.log_format in ('csv', 'both') else None
+    binlog = None
+    if args.log_format in ('binary', 'both'):
+        fps = args.fps or (video_fps(args.video) if args.video else 30.0)
+        binlog = AttentionLogWriter('attention_log.atl', fps, args.start_time, source)
+    num_frames = save_attention_log(smoothed, csv_path, binlog)
+    if binlog is not None:
+        print(f"INFO: Per-frame smoothed attention log saved to 'attention_log.atl' ({fps:g} fps)")
+    if cache is not None:
+        cache.close()
+    if prefetch_stats.frames:
+        print(f"INFO: {prefetch_stats.summary()}")
+
+    if show:
+        cv2.destroyAllWindows()
+
+    # --- 2. Block Analysis ---
+    rows = ((fname, 'ATTENTIVE' if flag else 'DISTRACTED') for fname, flag in zip(frame_names, attentive))
+    block_analysis_results = analyse_blocks(rows, num_frames)
+
+    # --- 3. Save the Block Analysis Report ---
+    save_block_report(block_analysis_results)
+
 
-# --- 2. Save the Block Analysis Report ---
-# This creates a simple text file with the block summary.
-with open('block_analysis_report.txt', 'w') as f:
-    f.write("Attention Analysis by Block\n")
-    f.write("===========================\n\n")
-    for res in block_analysis_results:
-        f.write(f"{res['block_name']} (Frames {res['start_frame']} to {res['end_frame']}):\n")
-        f.write(f"  - Attention Percentage: {res['attention_percentage']}\n")
-        f.write(f"  - Status: {res['status']}\n\n")
-print("\nINFO: Block analysis report saved to 'block_analysis_report.txt'")
-
-
-# --- 3. Save the Per-Frame Smoothed Results to CSV ---
-# FIX: This now correctly saves the SMOOTHED `sm` results.
-with open('attention_log.csv', 'w', newline='') as f:
-    writer = csv.writer(f)
-    writer.writerow(['frame_filename', 'attention_label'])
-    writer.writerows(sm) # <-- Use sm, not results
-    
-print("INFO: Per-frame smoothed attention log saved to 'attention_log.csv'")
+if __name__ == '__main__':
+    main()
@@ -24,12 +24,32 @@ from GUI.interaction_manager import InteractionManager
 # ===================================================================
 def interaction():
     import os
-    PEPPER_IP   = os.environ.get('PEPPER_IP', '192.168.1.100')
-    PEPPER_PORT = int(os.environ.get('PEPPER_PORT', '9559'))
-    PEPPER_LANG = os.environ.get('PEPPER_LANG', 'Italian')
-    PEPPER_VOL  = float(os.environ.get('PEPPER_VOL', '0.8'))
-    PEPPER_SPD  = int(os.environ.get('PEPPER_SPD', '90'))
-    PEPPER_TOOLS_HOME = os.getenv('PEPPER_TOOLS_HOME')
+    import sys
+
+    # settings come from the environment, or from SESSION_CONFIG when
+    # session_runtime.py runs several sessions in one process
+    _session_config = globals().get('SESSION_CONFIG') or {}
+
+    def _setting(name, default=None):
+        return _session_config.get(name, os.environ.get(name, default))
+
+    PEPPER_IP   = _setting('PEPPER_IP', '192.168.1.100')
+    PEPPER_PORT = int(_setting('PEPPER_PORT', '9559'))
+    PEPPER_LANG = _setting('PEPPER_LANG', 'Italian')
+    PEPPER_VOL  = float(_setting('PEPPER_VOL', '0.8'))
+    PEPPER_SPD  = int(_setting('PEPPER_SPD', '90'))
+    PEPPER_TOOLS_HOME = _setting('PEPPER_TOOLS_HOME')
+    PEPPER_FAKE_NAOQI = _setting('PEPPER_FAKE_NAOQI', '0') == '1'
+
+    # helper modules shipped in the scripts/ folder of the demo
+    SCRIPTS_DIR = os.path.join(im.path, 'scripts')
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.append(SCRIPTS_DIR)
+
+    # one NAOqi connection for the whole process: services are fetched lazily
+    # and the session reconnects by itself (PEPPER_FAKE_NAOQI=1 runs off-robot)
+    import naoqi_session
+    NAOQI = naoqi_session.shared_session(PEPPER_IP, PEPPER_PORT, fake=PEPPER_FAKE_NAOQI)
 
     def _build_robot_say():
         # 1) prova pepper_cmd se presente
@@ -49,22 +69,24 @@ def interaction():
             except:  # inizializzazione soft
                 pass
 
-            def _say_pc(text, speed=None, volume=None):
+            def _say_pc(text, speed=None, volume=None, wait=False):
                 try:
-                    _pc_robot.asay(text)
+                    if wait:
+                        _pc_robot.say(text)     # ritorna a fine frase
+                    else:
+                        _pc_robot.asay(text)
                 except:
                     pass
             return _say_pc
         except:
             pass
 
-        # 2) fallback NAOqi ufficiale (qi / ALProxy)
+        # 2) fallback NAOqi ufficiale (sessione condivisa / ALProxy)
         _tts = None
         try:
-            import qi
-            _session = qi.Session()
-            _session.connect("tcp://%s:%d" % (PEPPER_IP, PEPPER_PORT))
-            _tts = _session.service("ALTextToSpeech")
+            if not NAOQI.available():
+                raise RuntimeError("NAOqi not reachable")
+            _tts = NAOQI.service("ALTextToSpeech")
         except:
             try:
                 from naoqi import ALProxy
@@ -80,7 +102,7 @@ def interaction():
             try: _tts.setParameter("speed", PEPPER_SPD)
             except: pass
 
-            def _say_naoqi(text, speed=None, volume=None):
+            def _say_naoqi(text, speed=None, volume=None, wait=True):
                 try:
                     prefix = ""
                     if volume is not None:
@@ -102,6 +124,25 @@ def interaction():
     global robot_say
     robot_say = _build_robot_say()
 
+    # fixed phrases are rendered to audio files once per robot, language,
+    # speed and volume and played from the cache, any other text is said live.
+    # TTS_CACHE=0 disables it; off-robot the files are silent local WAVs.
+    import tts_cache
+    phrase_cache = None
+    if _setting('TTS_CACHE', '1') == '1':
+        if PEPPER_FAKE_NAOQI:
+            _cache_dir = os.path.join(SCRIPTS_DIR, 'tts_cache')
+            phrase_cache = tts_cache.shared_cache(
+                'local', _cache_dir, os.path.join(_cache_dir, tts_cache.INDEX_FILE),
+                PEPPER_LANG, PEPPER_SPD, PEPPER_VOL, tts_cache.LocalBackend)
+        elif NAOQI.available():
+            phrase_cache = tts_cache.shared_cache(
+                NAOQI.url, tts_cache.ROBOT_CACHE_DIR, os.path.join(SCRIPTS_DIR, tts_cache.INDEX_FILE),
+                PEPPER_LANG, PEPPER_SPD, PEPPER_VOL,
+                lambda: tts_cache.RobotBackend(NAOQI, PEPPER_LANG, PEPPER_SPD, PEPPER_VOL), local_files=False)
+    if phrase_cache is not None:
+        robot_say = tts_cache.Speaker(phrase_cache, robot_say)
+
     def _build_robot_gesture():
         # 1) pepper_cmd se disponibile
         try:
@@ -123,12 +164,11 @@ def interaction():
         except Exception:
             pass
 
-        # 2) fallback NAOqi (qi) -> ALAnimationPlayer
+        # 2) fallback NAOqi (sessione condivisa) -> ALAnimationPlayer
         try:
-            import qi
-            _session = qi.Session()
-            _session.connect("tcp://%s:%d" % (PEPPER_IP, PEPPER_PORT))
-            _anim = _session.service("ALAnimationPlayer")
+            if not NAOQI.available():
+                raise RuntimeError("NAOqi not reachable")
+            _anim = NAOQI.service("ALAnimationPlayer")
             def _run(anim_id, async_run=True):
                 try:
                     if async_run:
@@ -167,12 +207,26 @@ def interaction():
 
     play_gesture = _make_play_gesture(GESTURES, robot_gesture)
 
+    # lesson pacing: speech and gestures run together and each step waits for
+    # them to really finish instead of sleeping a fixed time
+    import interaction_scheduler
+    import session_trace
+    # every wait of the session goes through this clock; harnesses running
+    # the session (benchmarks, replays) can pass their own in SESSION_CLOCK
+    clock = globals().get('SESSION_CLOCK') or interaction_scheduler.Clock()
+    # per-step latency trace, SESSION_TRACE=1 to enable (tracer.enabled can
+    # also be switched while the session runs)
+    tracer = session_trace.Tracer(os.path.join(SCRIPTS_DIR, 'session_trace.jsonl'),
+                                  enabled=_setting('SESSION_TRACE', '0') == '1',
+                                  clock=clock.time, session_id=_setting('SESSION_ID'))
+    scheduler = interaction_scheduler.Scheduler(
+        say=lambda text: robot_say(text, wait=True),
+        gesture=lambda key: play_gesture(key, async_run=False),
+        clock=clock, tracer=tracer)
+
     def robot_show_url(url):
         try:
-            import qi, os
-            session = qi.Session()
-            session.connect("tcp://%s:%d" % (os.environ.get('PEPPER_IP'), int(os.environ.get('PEPPER_PORT','9559'))))
-            tablet = session.service("ALTabletService")
+            tablet = NAOQI.service("ALTabletService")
             tablet.showWebview()
             tablet.loadUrl(url)
         except Exception as e:
@@ -182,13 +236,66 @@ def interaction():
     tablet_url = "http://<IP_DEL_MIO_PC>:8000/index.html"   # o la pagina display MODIM corretta
     robot_show_url(tablet_url)
 
+    # actions precompiled by action_bundle.py: a bundled action is sent to the
+    # tablet modality by modality, without MODIM parsing its file each time.
+    # Actions missing from the bundle (or a stale bundle) go through MODIM,
+    # and so do the questions: im.ask(name) arms the buttons and the ASR
+    # vocabulary of the action it shows. A bundle resolved for another
+    # profile than the session's (im.profile) is not used.
+    import action_bundle
+    ACTION_BUNDLE = action_bundle.load_bundle(im.path, profile=getattr(im, 'profile', None))
+    BUNDLED_ACTIONS = ACTION_BUNDLE['actions'] if ACTION_BUNDLE else {}
+    if ACTION_BUNDLE:
+        print("INFO: %d precompiled actions for profile <%s>" % (len(BUNDLED_ACTIONS), ','.join(ACTION_BUNDLE['profile'])))
+
+    def run_action(name):
+        steps = BUNDLED_ACTIONS.get(name)
+        if steps is None:
+            return im.execute(name)
+        for modality, value in steps:
+            im.executeModality(modality, value)
+
+    def ask_action(name, timeout=-1):
+        # every answer is traced with its response time, so that
+        # session_replay.py can replay a traced session
+        start = clock.time()
+        answer = im.ask(name, timeout=timeout)
+        tracer.record("answer", start, clock.time(), action=name, answer=answer, timeout=timeout)
+        return answer
+
+    # tablet assets: the images of a subject's lessons are pushed to the tablet
+    # as soon as the subject is chosen, so they are cached before Pepper talks.
+    # qaws.js logs the time-to-display of every image in the browser console.
+    TABLET_BASE_URL = tablet_url.rsplit('/', 1)[0] + '/'
+    preloaded_images = set()
+
+    def preload_lesson_assets(lessons):
+        names = []
+        for lesson in lessons:
+            names.extend(lesson[k] for k in ("announce_action", "explanation_action", "question_action"))
+        images = [img for img in action_bundle.action_images(im.path, names, ACTION_BUNDLE)
+                  if img not in preloaded_images]
+        if not images:
+            return 0
+        # browser cache warm-up, handled by qaws.js
+        im.executeModality('TEXT_preload', '|'.join(images))
+        # tablet cache; images not preloaded are tried again next time
+        tablet = NAOQI.service("ALTabletService")
+        done = []
+        for img in images:
+            try:
+                tablet.preLoadImage(TABLET_BASE_URL + img)
+            except Exception as e:
+                print("Tablet preLoadImage error:", e)
+                break
+            done.append(img)
+        preloaded_images.update(done)
+        return len(done)
+
 
     # === GESTURES HELPERS (inside interaction) ===
     def _get_session():
-        import qi
-        s = qi.Session()
-        s.connect("tcp://%s:%d" % (PEPPER_IP, PEPPER_PORT))
-        return s
+        return NAOQI.session()
 
 
     """
@@ -196,9 +303,26 @@ def interaction():
     level, using the 'feedback_attentive' and 'feedback_distracted' actions.
     """
     # --- CONFIGURATION CONSTANTS AND DATA ---
-    ATTENTION_LOG_FILE = 'attention_mixed_distracted.csv'
+    ATTENTION_LOG_FILE = _setting('ATTENTION_LOG_FILE', 'attention_mixed_distracted.csv')
+    # 'log' replays ATTENTION_LOG_FILE, 'live' scores the labels published by
+    # live_attention_publisher.py while the explanation is on screen
+    ATTENTION_SOURCE = _setting('ATTENTION_SOURCE', 'log')
+    ATTENTION_STREAM_PORT = int(_setting('ATTENTION_STREAM_PORT', '5055'))
+    BENCHMARK_LOG_FILE = _setting('BENCHMARK_LOG_FILE', 'benchmark_log.csv')
+    # the quiz topics of a session are drawn from this seed (random unless
+    # set), it is traced so that a replay asks the same questions
+    import random
+    import zlib
+    QUIZ_SEED = _setting('QUIZ_SEED') or '%08x' % random.getrandbits(32)
     ATTENTION_THRESHOLD = 0.60
     READING_TIME_SECONDS = 10
+    # 'adaptive': the explanation stays up until the student has read it
+    # attentively for READING_BUDGET_SECONDS, between READING_MIN_SECONDS
+    # and READING_MAX_SECONDS, with a reminder when the attention drops
+    READING_PACING = _setting('READING_PACING', 'fixed')
+    READING_MIN_SECONDS = float(_setting('READING_MIN_SECONDS', '4'))
+    READING_MAX_SECONDS = float(_setting('READING_MAX_SECONDS', '20'))
+    READING_BUDGET_SECONDS = float(_setting('READING_BUDGET_SECONDS', '6'))
 
     SCIENCE_LESSONS = [
         {
@@ -315,32 +439,90 @@ def interaction():
         "music": MUSIC_LESSONS
     }
 
+    # answers are graded by whole words against the answer keys, the button
+    # labels of the questions (every language) and the synonyms in grammars/
+    import answer_matcher
+    ANSWER_MATCHER = answer_matcher.compile_matcher(
+        os.path.join(im.path, 'grammars'),
+        answers=[l["correct_answer"] for ls in ALL_LESSONS_DATA.values() for l in ls],
+        synonyms=action_bundle.button_labels(
+            im.path, [l["question_action"] for ls in ALL_LESSONS_DATA.values() for l in ls]))
+
+    # phrases said in every session, pre-rendered by the TTS cache; the
+    # templates are expanded with every topic, subject and quiz category
+    TTS_PHRASES = [
+        "Per favore leggi sul tablet. Tra poco ti farò una domanda.",
+        "Concentrati sulla lettura, per favore.",
+        "Ottima attenzione, continua così!",
+        "Attenzione un po' bassa, prova a concentrarti di più.",
+        "Risposta corretta, bravo!",
+        "Non è corretto. Rivediamo insieme.",
+        "Iniziamo il quiz di cultura generale.",
+        "Apro il menu delle lezioni.",
+        "Preparati al quiz.",
+        "Alla prossima! È stato un piacere lavorare con te.",
+    ]
+    QUIZ_CATEGORIES = ["Science", "History", "Math", "Music"]
+    if phrase_cache is not None:
+        phrase_cache.render_async(
+            TTS_PHRASES
+            + tts_cache.expand_templates(["Adesso parliamo di %s."],
+                                         [l["topic_name"] for ls in ALL_LESSONS_DATA.values() for l in ls])
+            + tts_cache.expand_templates(["La lezione di %s termina qui. Torniamo al menu tra poco."],
+                                         list(ALL_LESSONS_DATA))
+            + tts_cache.expand_templates(["Categoria: %s."], QUIZ_CATEGORIES)
+            + ["Hai totalizzato %d su %d." % (n, len(QUIZ_CATEGORIES)) for n in range(len(QUIZ_CATEGORIES) + 1)])
+
     # --- UTILITY FUNCTIONS ---
     def load_attention_log(log_filename):
-        import csv
         import os
+        import attention_log
         demo_path = im.path
         log_file_full_path = os.path.join(demo_path, 'scripts', log_filename)
         print("INFO: Attempting to load attention log from: %s" % log_file_full_path)
         if not os.path.exists(log_file_full_path):
             print("ERROR: '%s' not found." % log_filename)
             return None
-        with open(log_file_full_path, 'r') as f:
-            reader = csv.reader(f); next(reader); data = [row[1] for row in reader]
+        # parsed once per process, reloaded only when the file changes
+        data = attention_log.load_cached(log_file_full_path)
         print("INFO: Loaded %d labels." % len(data)); return data
 
+    def open_attention_stream(log_filename=None):
+        # Live mode: the log file is not used, labels come from the local publisher
+        from attention_stream import shared_stream
+        return shared_stream(port=ATTENTION_STREAM_PORT)
+
     def was_user_attentive(attention_data, start_frame, num_frames, threshold):
-        end_frame = start_frame + num_frames
-        if end_frame > len(attention_data):
-            end_frame = len(attention_data)
+        if hasattr(attention_data, 'labels_between'):
+            # Live stream: start_frame/num_frames are the start time and the
+            # duration (seconds) of the explanation
+            segment = attention_data.labels_between(start_frame, start_frame + num_frames)
+            stats = attention_data.latency_stats()
+            if stats:
+                print("--- Live attention: %d labels, capture latency mean %.1f ms, p95 %.1f ms, newest %.1f ms old"
+                      % (len(segment), stats["mean_ms"], stats["p95_ms"], stats["newest_age_ms"]))
+            if not segment:
+                # no label arrived (publisher down or not started): no score, not a perfect one
+                print("WARNING: no live attention labels during the explanation, is the publisher running?")
+                im.executeModality('TEXT_default', "Your Attention Score: no data")
+                return (None, None)
+            start_frame, end_frame = 0, len(segment)
+        else:
+            end_frame = start_frame + num_frames
+            if end_frame > len(attention_data):
+                end_frame = len(attention_data)
+
         if start_frame >= end_frame:
             im.executeModality('TEXT_attentionscore', '100')
             im.executeModality('TEXT_default', "Your Attention Score: 100%")
             return (True, 100)
 
-        segment = attention_data[start_frame:end_frame]
-        attentive_count = segment.count('ATTENTIVE')
-        total_count = len(segment)
+        if hasattr(attention_data, 'labels_between'):
+            attentive_count = segment.count('ATTENTIVE')
+        else:
+            # prefix-sum index: one subtraction whatever the window size
+            attentive_count = attention_data.count_attentive(start_frame, end_frame)
+        total_count = end_frame - start_frame
         score = (float(attentive_count) / total_count) if total_count > 0 else 0
         score_percentage = int(score * 100)
 
@@ -354,7 +536,6 @@ def interaction():
     # --- CORE LOGIC SUB-FUNCTIONS ---
     def run_lesson_session(dependencies):
         import math
-        import time
 
         attention_scores = []
 
@@ -365,18 +546,25 @@ def interaction():
         attention_log_file = dependencies["attention_log_file"]
         threshold = dependencies["threshold"]
         reading_time = dependencies["reading_time"]
+        pacer = dependencies["reading_pacer"]
         quiz_runner = dependencies["quiz_runner"]
-        pg = dependencies.get("play_gesture")
+        sched = dependencies["scheduler"]
+        tracer = dependencies["tracer"]
+        results_writer = dependencies["results_writer"]
 
-        attention_data = log_loader(attention_log_file)
+        tracer.set_context(subject=subject_name, topic=None)
+        with tracer.span("attention_load"):
+            attention_data = log_loader(attention_log_file)
         if attention_data is None:
             im.executeModality('TEXT_default', "Error: I cannot start the lesson, my learning materials are missing.")
             return
 
         learned_topics = []
         num_lessons = len(lessons)
+        live_attention = hasattr(attention_data, 'labels_between')
         total_frames = len(attention_data)
         block_size = int(math.ceil(total_frames / float(num_lessons))) if num_lessons > 0 else 0
+        reading_saved = []
 
         current_topic_index = 0
         for i in range(num_lessons):
@@ -386,66 +574,98 @@ def interaction():
 
             lesson = lessons[current_topic_index]
             start_frame_block = i * block_size
+            tracer.set_context(topic=lesson["topic_name"])
 
             # --- RESET THE ATTENTION BAR FOR NEW TOPIC ---
             im.executeModality('TEXT_attentionscore', '0')
 
             # 1) Topic announcement
-            im.execute(lesson["announce_action"])
             #play_gesture("explain")
-            robot_say("Adesso parliamo di %s." % lesson["topic_name"])
-            time.sleep(3)
-
-            # 2) Explanation and text
-            im.execute(lesson["explanation_action"])
-            robot_say("Per favore leggi sul tablet. Tra poco ti farò una domanda.")
-            time.sleep(reading_time)
+            sched.step(show=lambda: run_action(lesson["announce_action"]),
+                       say="Adesso parliamo di %s." % lesson["topic_name"],
+                       name="announce", action=lesson["announce_action"])
+
+            # 2) Explanation and text (on screen for reading_time, speech included)
+            explanation_start = sched.clock.time()
+            sched.step(show=lambda: run_action(lesson["explanation_action"]),
+                       say="Per favore leggi sul tablet. Tra poco ti farò una domanda.",
+                       hold=0 if pacer else reading_time, name="explanation",
+                       action=lesson["explanation_action"])
+            if pacer:
+                # the recorded block of a lesson spans reading_time seconds
+                if live_attention:
+                    source = reading_pacer.stream_source(attention_data)
+                else:
+                    source = reading_pacer.log_source(attention_data, start_frame_block,
+                                                      block_size / float(reading_time), explanation_start)
+                pace = pacer.pace(source, explanation_start,
+                                  on_low=lambda: sched.step(say="Concentrati sulla lettura, per favore.",
+                                                            gesture="no", name="reading.reprompt"))
+                reading_saved.append(pace.saved(reading_time))
+                tracer.record("reading", explanation_start, sched.clock.time(), reason=pace.reason,
+                              reprompts=pace.reprompts, saved_s=round(pace.saved(reading_time), 1))
+                print("--- Reading: %.1f s (%.1f s attentive, %s, %d reminders), %+.1f s against %d s"
+                      % (pace.elapsed, pace.attentive_time, pace.reason, pace.reprompts,
+                         pace.saved(reading_time), reading_time))
 
             # 3) Calculate and show attention Score
-            is_attentive, score_percentage = attention_checker(attention_data, start_frame_block, block_size, threshold)
-            attention_scores.append(score_percentage)
-            if score_percentage >= int(threshold * 100):
-                robot_say("Ottima attenzione, continua così!")
-                if pg: pg("yes")
+            if live_attention:
+                # score what the student did while the explanation was shown
+                window_start, window_length = explanation_start, sched.clock.time() - explanation_start
+            elif pacer:
+                # the frames replayed while the explanation was shown
+                window_start = start_frame_block
+                window_length = max(1, int(round((sched.clock.time() - explanation_start)
+                                                 * block_size / float(reading_time))))
             else:
-                robot_say("Attenzione un po' bassa, prova a concentrarti di più.")
-                if pg: pg("no")
-
-
-            time.sleep(3)
+                window_start, window_length = start_frame_block, block_size
+            with tracer.span("attention_score"):
+                is_attentive, score_percentage = attention_checker(attention_data, window_start, window_length, threshold)
+            if score_percentage is not None:    # None: no attention data, no feedback on it
+                attention_scores.append(score_percentage)
+                if score_percentage >= int(threshold * 100):
+                    sched.step(say="Ottima attenzione, continua così!", gesture="yes", name="attention_feedback")
+                else:
+                    sched.step(say="Attenzione un po' bassa, prova a concentrarti di più.", gesture="no",
+                               name="attention_feedback")
 
             # 4) Question to the student
-            answer = im.ask(lesson["question_action"], timeout=15)
+            with tracer.span("ask", action=lesson["question_action"]):
+                answer = ask_action(lesson["question_action"], timeout=15)
 
             # 5) Evaluate the answer
-            is_correct      = answer and (lesson["correct_answer"].lower() in answer.lower())
+            is_correct      = dependencies["answer_matcher"].matches(answer, lesson["correct_answer"])
             is_last_block   = (i == num_lessons - 1)
 
             # keep track of mastered topics
             if is_correct:
                 learned_topics.append(lesson["topic_name"])
+            if is_attentive is None:
+                feedback_type = "none"
+            else:
+                feedback_type = "attentive" if is_attentive else "distracted"
+            results_writer.add(lesson["topic_name"], score_percentage, is_correct, feedback_type,
+                               subject=subject_name)
 
             # ------- feedback to the student -------
             if is_correct:
-                im.executeModality('TEXT_default', "Correct answer! Well done.")
-                robot_say("Risposta corretta, bravo!")
-                if pg: pg("happy")
+                sched.step(show=lambda: im.executeModality('TEXT_default', "Correct answer! Well done."),
+                           say="Risposta corretta, bravo!", gesture="happy", name="answer_feedback")
                 if lesson["topic_name"] not in learned_topics:    
                     learned_topics.append(lesson["topic_name"])
                 current_topic_index += 1
             else:
-                im.executeModality('TEXT_default', "Wrong answer. Let’s review this topic.")
-                robot_say("Non è corretto. Rivediamo insieme.")
-                if pg: pg("no")
-
-            time.sleep(3)
+                sched.step(show=lambda: im.executeModality('TEXT_default', "Wrong answer. Let’s review this topic."),
+                           say="Non è corretto. Rivediamo insieme.", gesture="no", name="answer_feedback")
 
             # 6) Feedback based on attention
-            if is_attentive:
-                im.execute("feedback_attentive")
-            else:
-                im.execute("feedback_distracted")
-            time.sleep(3)
+            if is_attentive is not None:
+                with tracer.span("feedback", action="feedback_attentive" if is_attentive else "feedback_distracted"):
+                    if is_attentive:
+                        run_action("feedback_attentive")
+                    else:
+                        run_action("feedback_distracted")
+            sched.pause(3, name="feedback.hold")
 
 
         # Final summary of lessons completed
@@ -454,21 +674,24 @@ def interaction():
         else:
             msg = "There are no successfully completed topics."
 
+        tracer.set_context(topic=None)
         im.executeModality('TEXT_default', msg)
-        time.sleep(5)        
+        sched.pause(5, name="learned_topics.hold")
 
         if attention_scores:
             avg_score = sum(attention_scores) / len(attention_scores)
-            im.executeModality('TEXT_default', "Your average attention was: {:.0f}%".format(avg_score))
-            robot_say("La tua attenzione media è stata del %d per cento." % int(avg_score))
+            sched.step(show=lambda: im.executeModality('TEXT_default', "Your average attention was: {:.0f}%".format(avg_score)),
+                       say="La tua attenzione media è stata del %d per cento." % int(avg_score),
+                       name="summary")
             print("DEBUG - Attention Scores:", attention_scores)
             print("DEBUG - Average:", avg_score)
         else:
             im.executeModality('TEXT_default', "No attention data available.")
 
 
-        print("DEBUG - Attention Scores:", attention_scores)
-        print("DEBUG - Average:", sum(attention_scores) / len(attention_scores))
+        if reading_saved:
+            print("INFO: adaptive reading saved %+.1f s over %d explanations (%s)"
+                  % (sum(reading_saved), len(reading_saved), ", ".join("%+.1f" % s for s in reading_saved)))
 
 
         im.executeModality(
@@ -479,8 +702,11 @@ def interaction():
 
         # --- RESET THE WARNING BAR AT THE END OF THE LESSON ---
         im.executeModality('TEXT_attentionscore', '0')
-        robot_say("La lezione di %s termina qui. Torniamo al menu tra poco." % subject_name)
-        time.sleep(5)          # hold the goodbye message
+        sched.step(say="La lezione di %s termina qui. Torniamo al menu tra poco." % subject_name,
+                   hold=5, name="lesson_end")     # hold the goodbye message
+        tracer.set_context(subject=None)
+        tracer.flush()
+        results_writer.flush()
 
 
     def run_subject_menu(dependencies):
@@ -488,11 +714,14 @@ def interaction():
         all_lessons = dependencies["all_lessons_data"]
 
         while True:
-            choice = im.ask("menu_subjects", timeout=20)
+            choice = ask_action("menu_subjects", timeout=20)
 
             if choice in all_lessons:
                 dependencies["subject_name"] = choice
                 dependencies["current_lessons"] = all_lessons[choice] 
+                with dependencies["tracer"].span("preload", subject=choice):
+                    count = dependencies["asset_preloader"](all_lessons[choice])
+                print("INFO: %d images preloaded for %s" % (count, choice))
                 dependencies["lesson_runner"](dependencies)
                 
             elif choice in ("back", "timeout"):
@@ -502,38 +731,46 @@ def interaction():
                 im.executeModality('TEXT_default', "I didn't understand. Please choose an option.")
 
     def run_general_quiz(dependencies):
-        import time
-        import random
-
         all_lessons = dependencies["all_lessons_data"]
+        sched = dependencies["scheduler"]
+        tracer = dependencies["tracer"]
+        results_writer = dependencies["results_writer"]
+        rng = dependencies["quiz_rng"]
+        tracer.set_context(subject="quiz", topic=None)
+
+        def _pick(lessons):
+            # rng.random() is the same on Python 2 and 3, rng.choice() is not
+            return lessons[int(rng.random() * len(lessons))]
 
         topics = {
-            "Science": random.choice(all_lessons["science"]),
-            "History": random.choice(all_lessons["history"]),
-            "Math": random.choice(all_lessons["math"]),
-            "Music": random.choice(all_lessons["music"])
+            "Science": _pick(all_lessons["science"]),
+            "History": _pick(all_lessons["history"]),
+            "Math": _pick(all_lessons["math"]),
+            "Music": _pick(all_lessons["music"])
         }
 
 
         correct_count = 0
         total = len(topics)
 
-        im.executeModality('TEXT_default', "Let's begin the general knowledge quiz!")
-        robot_say("Iniziamo il quiz di cultura generale.")
-        if pg: pg("hey")
-        time.sleep(2)
+        sched.step(show=lambda: im.executeModality('TEXT_default', "Let's begin the general knowledge quiz!"),
+                   say="Iniziamo il quiz di cultura generale.", gesture="hey", name="quiz_start")
 
-        for subject, lesson in topics.items():
-            im.executeModality('TEXT_default', "Category: {}".format(subject))
-            robot_say("Categoria: %s." % subject)
-            time.sleep(1)
+        for subject in QUIZ_CATEGORIES:
+            lesson = topics[subject]
+            tracer.set_context(topic=lesson["topic_name"])
+            sched.step(show=lambda: im.executeModality('TEXT_default', "Category: {}".format(subject)),
+                       say="Categoria: %s." % subject, name="category")
 
-            im.execute(lesson["announce_action"])
-            time.sleep(2)
+            with tracer.span("announce.show", action=lesson["announce_action"]):
+                run_action(lesson["announce_action"])
+            sched.pause(2, name="announce.hold")
 
-            answer = im.ask(lesson["question_action"], timeout=15)
+            with tracer.span("ask", action=lesson["question_action"]):
+                answer = ask_action(lesson["question_action"], timeout=15)
 
-            if answer and lesson["correct_answer"].lower() in answer.lower():
+            is_correct = dependencies["answer_matcher"].matches(answer, lesson["correct_answer"])
+            if is_correct:
                 im.executeModality('TEXT_default', "Correct answer! Well done.")
                 correct_count += 1
             else:
@@ -541,13 +778,15 @@ def interaction():
                     'TEXT_default',
                     "Wrong. The correct answer was '{}'.".format(lesson['correct_answer'])
                 )
-            time.sleep(2)
+            results_writer.add(lesson["topic_name"], None, is_correct, "none",
+                               subject=subject.lower(), mode="quiz")
+            sched.pause(2, name="answer_feedback.hold")
+        tracer.set_context(topic=None)
 
         score_percent = int((correct_count / float(total)) * 100)
         final_msg = "You scored {} out of {} ({}%).".format(correct_count, total, score_percent)
-        im.executeModality('TEXT_default', final_msg)
-        robot_say("Hai totalizzato %d su %d." % (correct_count, total))
-        time.sleep(3)
+        sched.step(show=lambda: im.executeModality('TEXT_default', final_msg),
+                   say="Hai totalizzato %d su %d." % (correct_count, total), name="quiz_score")
 
         if score_percent == 100:
             im.executeModality('TEXT_default', "Excellent work! You're a true knowledge master!")
@@ -557,42 +796,74 @@ def interaction():
             im.executeModality('TEXT_default', "Not bad! But you can do better with some revision.")
         else:
             im.executeModality('TEXT_default', "Keep practicing and you'll improve!")
-        time.sleep(3)
+        sched.pause(3, name="quiz_end.hold")
+        tracer.set_context(subject=None)
+        tracer.flush()
+        results_writer.flush()
 
 
 
     def start_interaction_controller(dependencies):
-        import time
+        sched = dependencies["scheduler"]
+        tracer = dependencies["tracer"]
+        now = clock.time()
+        tracer.record("session", now, now, attention_log=dependencies["attention_log_file"],
+                      attention_source=ATTENTION_SOURCE, reading_pacing=READING_PACING, quiz_seed=QUIZ_SEED)
         while True:
-            choice = im.ask("welcome_educational_quiz", timeout=30)
+            with tracer.span("ask", action="welcome_educational_quiz"):
+                choice = ask_action("welcome_educational_quiz", timeout=30)
             if choice == "lessons":
-                robot_say("Apro il menu delle lezioni.")
+                sched.step(say="Apro il menu delle lezioni.")
                 dependencies["subject_menu_runner"](dependencies)
             elif choice == "quiz":
-                robot_say("Preparati al quiz.")
+                sched.step(say="Preparati al quiz.")
                 dependencies["quiz_runner"](dependencies)
             elif choice in ("exit", "timeout"):
                 break
             else:
                 im.executeModality('TEXT_default', "Sorry, I didn't get that. Please choose an option from the menu.")
-            time.sleep(1)
+            sched.pause(1)
 
-        im.execute("goodbye")
-        robot_say("Alla prossima! È stato un piacere lavorare con te.")
+        sched.step(show=lambda: run_action("goodbye"),
+                   say="Alla prossima! È stato un piacere lavorare con te.", name="goodbye")
+        tracer.close()
+        if phrase_cache is not None:
+            print("INFO: TTS cache: %d phrases from cache, %d said live" % (robot_say.hits, robot_say.misses))
         print("--- Remote Script Execution Finished ---")
 
+    import reading_pacer
+    if READING_PACING == 'adaptive':
+        lesson_pacer = reading_pacer.ReadingPacer(clock, min_time=READING_MIN_SECONDS,
+                                                  max_time=READING_MAX_SECONDS,
+                                                  budget=READING_BUDGET_SECONDS,
+                                                  low_score=ATTENTION_THRESHOLD)
+    else:
+        lesson_pacer = None
+
+    # append-only results of every topic, shared by all sessions
+    import benchmark_writer
+    results_writer = benchmark_writer.BenchmarkWriter(os.path.join(SCRIPTS_DIR, BENCHMARK_LOG_FILE),
+                                                      session_id=tracer.session_id, clock=clock.time)
+
     # --- DICTIONARY OF ALL DEPENDENCIES ---
     app_dependencies = {
-        "log_loader": load_attention_log,
+        "log_loader": open_attention_stream if ATTENTION_SOURCE == 'live' else load_attention_log,
         "attention_checker": was_user_attentive,
         "attention_log_file": ATTENTION_LOG_FILE,
         "threshold": ATTENTION_THRESHOLD,
         "reading_time": READING_TIME_SECONDS,
+        "reading_pacer": lesson_pacer,
         "lesson_runner": run_lesson_session,           
         "subject_menu_runner": run_subject_menu,
         "quiz_runner": run_general_quiz,
         "all_lessons_data": ALL_LESSONS_DATA, 
+        "answer_matcher": ANSWER_MATCHER,
         "play_gesture": play_gesture,
+        "asset_preloader": preload_lesson_assets,
+        "scheduler": scheduler,
+        "tracer": tracer,
+        "results_writer": results_writer,
+        "quiz_rng": random.Random(zlib.crc32(QUIZ_SEED.encode('utf-8')) & 0xffffffff),
 
         # This will be populated later by run_subject_menu
         "current_lessons": None, 
@@ -600,7 +871,11 @@ def interaction():
     }
 
     # --- FINAL ENTRY POINT ---
-    start_interaction_controller(app_dependencies)
+    try:
+        start_interaction_controller(app_dependencies)
+    finally:
+        # rows of a lesson cut short by an error or a disconnect
+        results_writer.flush()
 
 # ===================================================================
 #   CLIENT-SIDE EXECUTION BLOCK
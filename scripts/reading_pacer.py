@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Attention-adaptive reading time for the lesson explanations.
+
+Instead of holding every explanation for a fixed time, ReadingPacer polls
+the attention of the student while the text is on screen:
+  - the reading ends as soon as the student has been attentive for
+    `budget` seconds (and at least `min_time` seconds have passed);
+  - when the attention of the last `window` seconds drops under
+    `low_score`, on_low() is called (the robot asks the student to
+    focus) at most every `reprompt_every` seconds, and the reading goes
+    on until the budget is met;
+  - it never lasts more than `max_time` seconds.
+
+The attention comes from a source(t_start, t_end) -> (attentive, total)
+function: stream_source() for the live labels, log_source() for a
+recorded attention log replayed at a given frame rate.
+
+    python reading_pacer.py attention_log_attentive.csv --lessons 3
+
+replays a recorded log on a simulated clock and reports, per lesson, the
+reading time of the adaptive pacing against the fixed one.
+Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+ATTENTIVE = 'ATTENTIVE'
+
+
+def stream_source(stream):
+    # Source of an attention_stream.AttentionStream (times are capture times)
+    def _counts(t_start, t_end):
+        labels = stream.labels_between(t_start, t_end)
+        return labels.count(ATTENTIVE), len(labels)
+    return _counts
+
+
+def log_source(log, first_frame, fps, t0):
+    # Source of an attention_log.AttentionLog whose frame `first_frame` is
+    # shown at time t0, one frame every 1/fps seconds
+    def _counts(t_start, t_end):
+        start = first_frame + int(round((t_start - t0) * fps))
+        end = first_frame + int(round((t_end - t0) * fps))
+        end = min(end, len(log))
+        if end <= start:
+            return 0, 0
+        return log.count_attentive(start, end), end - start
+    return _counts
+
+
+class PaceResult(object):
+
+    def __init__(self, elapsed, attentive_time, reason, reprompts):
+        self.elapsed = elapsed                  # seconds the explanation stayed up
+        self.attentive_time = attentive_time    # seconds of attentive reading
+        self.reason = reason                    # 'budget', 'max_time' or 'no_data'
+        self.reprompts = reprompts
+
+    def saved(self, fixed_time):
+        # Seconds saved against a fixed reading time (negative when extended)
+        return fixed_time - self.elapsed
+
+
+class ReadingPacer(object):
+
+    def __init__(self, clock, min_time=4.0, max_time=20.0, budget=6.0, low_score=0.5,
+                 window=3.0, poll=0.5, reprompt_every=6.0):
+        if not 0 < min_time <= max_time:
+            raise ValueError("need 0 < min_time <= max_time")
+        self.clock = clock
+        self.min_time = min_time
+        self.max_time = max_time
+        self.budget = budget
+        self.low_score = low_score
+        self.window = window
+        self.poll = poll
+        self.reprompt_every = reprompt_every
+
+    def pace(self, source, start, on_low=None):
+        # Wait until the reading that started at `start` is over. source is
+        # polled on the new time slice only, so each poll costs O(slice)
+        attentive_time = 0.0
+        seen = False
+        slices = []                 # (t_end, attentive, total) of the last `window` seconds
+        last_reprompt = None
+        reprompts = 0
+        t = start
+        while True:
+            now = self.clock.time()
+            elapsed = now - start
+            if now > t:
+                attentive, total = source(t, now)
+                if total:
+                    seen = True
+                    attentive_time += (now - t) * attentive / float(total)
+                slices.append((now, attentive, total))
+                t = now
+            while slices and slices[0][0] < now - self.window:
+                slices.pop(0)
+
+            if elapsed >= self.max_time:
+                reason = 'max_time'
+                break
+            if elapsed >= self.min_time and attentive_time >= self.budget:
+                reason = 'budget'
+                break
+            if elapsed >= self.min_time and not seen:
+                # no labels at all (publisher down, log exhausted): fall back to the minimum
+                reason = 'no_data'
+                break
+
+            recent = sum(s[2] for s in slices)
+            if (on_low is not None and recent and elapsed >= self.window
+                    and sum(s[1] for s in slices) < self.low_score * recent
+                    and (last_reprompt is None or now - last_reprompt >= self.reprompt_every)):
+                reprompts += 1
+                last_reprompt = now
+                on_low()
+                continue
+            self.clock.sleep(min(self.poll, self.max_time - elapsed))
+        return PaceResult(self.clock.time() - start, attentive_time, reason, reprompts)
+
+
+class _SimClock(object):
+    # Clock whose sleep() only moves the time forward, for offline replays
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+def replay(log, lessons, fixed_time, pacer_args, reprompt_time=2.0):
+    # [(lesson, first_frame, PaceResult)] of a recorded log split in
+    # `lessons` blocks of fixed_time seconds each, like run_lesson_session
+    block = max(1, -(-len(log) // lessons))
+    fps = block / float(fixed_time)
+    clock = _SimClock()
+    pacer = ReadingPacer(clock, **pacer_args)
+    results = []
+    for i in range(lessons):
+        start = clock.time()
+        source = log_source(log, i * block, fps, start)
+        result = pacer.pace(source, start, on_low=lambda: clock.sleep(reprompt_time))
+        results.append((i + 1, i * block, result))
+    return results
+
+
+def main():
+    import argparse
+    import attention_log
+    parser = argparse.ArgumentParser(description="Replay an attention log with adaptive reading times.")
+    parser.add_argument('log', help="attention_log.csv or .atl file")
+    parser.add_argument('--lessons', type=int, default=3, help="lessons the log is split into")
+    parser.add_argument('--fixed', type=float, default=10.0, help="fixed reading time, seconds")
+    parser.add_argument('--min', type=float, default=4.0, dest='min_time')
+    parser.add_argument('--max', type=float, default=20.0, dest='max_time')
+    parser.add_argument('--budget', type=float, default=6.0, help="attentive seconds needed")
+    parser.add_argument('--low-score', type=float, default=0.5)
+    args = parser.parse_args()
+
+    log = attention_log.load_cached(args.log)
+    results = replay(log, args.lessons, args.fixed,
+                     dict(min_time=args.min_time, max_time=args.max_time,
+                          budget=args.budget, low_score=args.low_score))
+    print("%-7s %7s %9s %10s %9s %-9s" % ("lesson", "frame", "reading s", "attentive s", "saved s", "reason"))
+    for lesson, frame, r in results:
+        print("%-7d %7d %9.1f %10.1f %+9.1f %-9s%s" % (lesson, frame, r.elapsed, r.attentive_time,
+                                                      r.saved(args.fixed), r.reason,
+                                                      "  (%d reprompts)" % r.reprompts if r.reprompts else ""))
+    total = sum(r.saved(args.fixed) for _, _, r in results)
+    print("total saved: %+.1f s of %.1f s" % (total, args.fixed * len(results)))
+
+
+if __name__ == '__main__':
+    main()
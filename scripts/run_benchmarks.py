@@ -0,0 +1,296 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import attention_log
+import session_runtime
+from attention_smoothing import smooth_stream
+
+
+# ---------------------
+# Benchmark suite
+# ---------------------
+# Repeatable timings of the labeler stages, of the attention log scoring
+# and of a whole lesson session, written to a JSON file:
+#
+#     python run_benchmarks.py --output before.json
+#     python run_benchmarks.py --compare before.json
+#
+# --compare prints the ratio to an earlier run and exits with 1 when a
+# benchmark is slower by more than --tolerance, so regressions show up
+# before they reach the robot. Runs are compared on their fastest
+# repetition, the least disturbed by the rest of the machine. Benchmarks
+# whose dependencies are missing (cv2 / mediapipe for the labeler) are
+# reported as skipped.
+#
+# Inputs are generated (random landmarks and labels, noise frames) or
+# bundled (a face from img/). The session runs against in-process
+# stand-ins: session_runtime.ScriptedIM for the tablet, fake_naoqi for the
+# robot (speech and gestures return at once) and a clock that skips the
+# pacing waits, so only the work of the interaction code is timed.
+
+RESULTS_FILE = os.path.join(HERE, 'benchmark_results.json')
+SAMPLE_FACE = os.path.join(ROOT, 'img', 'composers.png')
+LOG_SIZES = (1000, 10000, 100000, 1000000)
+SESSION_ANSWERS = ['lessons', 'science', 'sunlight', 'the sun', 'heart', 'back', 'exit']
+
+
+def measure(fn, number=1, repeat=5):
+    # Timing of `number` calls of fn, repeated; per call values in ms
+    fn()    # warm-up: model loading, caches, imports
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number)
+    return {
+        "number": number,
+        "repeat": repeat,
+        "median_ms": round(1000.0 * statistics.median(runs), 4),
+        "min_ms": round(1000.0 * min(runs), 4),
+        "max_ms": round(1000.0 * max(runs), 4),
+    }
+
+
+def quiet(fn):
+    # fn with its prints discarded (the interaction code logs every step)
+    def _run(*args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn(*args, **kwargs)
+    return _run
+
+
+def random_labels(n, p_attentive=0.7, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random(n) < p_attentive, 'ATTENTIVE', 'DISTRACTED').tolist()
+
+
+# ---------------------
+# Labeler stages
+# ---------------------
+def bench_labeler(results, repeat):
+    try:
+        import cv2
+        import offline_labeler_with_eye_tracking as labeler
+    except ImportError as e:
+        return f"skipped: {e}"
+
+    face = cv2.imread(SAMPLE_FACE)
+    if face is None:
+        return f"skipped: sample frame '{SAMPLE_FACE}' not found"
+    frame = cv2.resize(face, (640, 640))
+    noise = np.random.default_rng(0).integers(0, 256, frame.shape, dtype=np.uint8)
+    status = "ok"
+    labeler.load_models()
+    try:
+        results["labeler.get_face_crop.no_face"] = measure(lambda: labeler.get_face_crop(noise), 10, repeat)
+        bbox = labeler.get_face_bbox(frame)
+        if bbox is None:
+            # record the case and time only what does not need a face
+            status = f"partial: no face detected in '{SAMPLE_FACE}', face benchmarks skipped"
+            print(f"WARNING: {status}")
+        else:
+            x1, y1, x2, y2 = bbox
+            crop = labeler.upscale_face(frame[y1:y2, x1:x2])
+            results["labeler.get_face_crop"] = measure(lambda: labeler.get_face_crop(frame), 10, repeat)
+            results["labeler.get_landmarks"] = measure(lambda: labeler.get_landmarks(crop.copy()), 10, repeat)
+            results["labeler.detect_eyes"] = measure(lambda: labeler.detect_eyes(frame), 10, repeat)
+            tracker = labeler.FaceTracker(max_frames=10 ** 9)
+            results["labeler.detect_eyes.tracked"] = measure(lambda: labeler.detect_eyes(frame, tracker),
+                                                             10, repeat)
+    finally:
+        labeler.close_models()
+
+    eyes = np.random.default_rng(0).random((10000,) + labeler.EYE_LANDMARKS.shape + (2,)) * 100
+    results["labeler.geometry.10k"] = measure(
+        lambda: labeler.attentive_mask(labeler.eye_positions(eyes)), 10, repeat)
+
+    rows = [(f"frame_{i:06d}.jpg", label) for i, label in enumerate(random_labels(100000))]
+    results["labeler.smoothing.100k"] = measure(lambda: sum(1 for _ in smooth_stream(rows, 5)), 1, repeat)
+    results["labeler.block_analysis.100k"] = measure(quiet(lambda: labeler.analyse_blocks(rows, len(rows))),
+                                                     1, repeat)
+    return status
+
+
+# ---------------------
+# Attention log loading and scoring
+# ---------------------
+class _NullIM:
+    path = ROOT
+
+    def execute(self, action):
+        pass
+
+    def executeModality(self, modality, value):
+        pass
+
+
+def bench_attention(results, repeat, workdir):
+    namespace = {'im': _NullIM()}
+    exec(session_runtime.load_interaction(session_runtime.DEFAULT_SCRIPT, 'was_user_attentive'), namespace)
+    was_user_attentive = quiet(namespace['was_user_attentive'])
+
+    for n in LOG_SIZES:
+        path = os.path.join(workdir, f"attention_{n}.csv")
+        with open(path, 'w') as f:
+            f.write("frame_filename,attention_label\n")
+            for i, label in enumerate(random_labels(n)):
+                f.write(f"frame_{i:07d}.jpg,{label}\n")
+
+        def _load():
+            attention_log.invalidate(path)
+            return attention_log.load_cached(path)
+        results[f"attention.load.{n}"] = measure(_load, max(1, 10000 // n), repeat)
+
+        log = attention_log.load_cached(path)
+        block = -(-n // 3)
+        results[f"attention.was_user_attentive.{n}"] = measure(
+            lambda: [was_user_attentive(log, i * block, block, 0.6) for i in range(3)], 100, repeat)
+    return "ok"
+
+
+# ---------------------
+# Whole lesson session
+# ---------------------
+class NoWaitClock:
+    # Scheduler clock skipping the pacing waits: time goes on as if they
+    # had been waited, but only the work is spent
+
+    def __init__(self):
+        self.skipped = 0.0
+
+    def time(self):
+        return time.time() + self.skipped
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.skipped += seconds
+
+    def wait(self, event, timeout=None):
+        return event.wait(timeout)
+
+
+def session_root(workdir):
+    # MODIM app folder for the session: the repo's actions, images and
+    # grammars, with a scripts/ folder of its own for the logs it writes
+    return session_runtime.scratch_root(workdir, ROOT)
+
+
+def bench_session(results, repeat, workdir):
+    import fake_naoqi
+    root = session_root(workdir)
+    runtime = session_runtime.SessionRuntime()
+    config = {'PEPPER_FAKE_NAOQI': '1', 'PEPPER_IP': 'benchmark', 'TTS_CACHE': '0', 'SESSION_TRACE': '0'}
+    reports = []
+
+    def _run():
+        fake_naoqi.reset()
+        session = session_runtime.Session('bench', session_runtime.ScriptedIM(root, SESSION_ANSWERS),
+                                          config, session_clock=NoWaitClock())
+        quiet(session.run)(runtime.code)
+        if session.error:
+            raise RuntimeError(f"lesson session failed: {session.error}")
+        reports.append(session.report())
+
+    results["session.lesson.science"] = measure(_run, 5, repeat)
+    results["session.lesson.science"]["im_calls"] = reports[-1]["im_calls"]
+    return "ok"
+
+
+GROUPS = {
+    "labeler": lambda results, repeat, workdir: bench_labeler(results, repeat),
+    "attention": bench_attention,
+    "session": bench_session,
+}
+
+
+# ---------------------
+# Results
+# ---------------------
+def compare(results, baseline, tolerance):
+    # Print the ratio of every benchmark to the baseline; names of the regressions
+    regressions = []
+    print(f"\n{'benchmark (min)':<40} {'before ms':>12} {'now ms':>12} {'ratio':>7}")
+    for name, now in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<40} {'-':>12} {now['min_ms']:>12.3f}")
+            continue
+        ratio = now['min_ms'] / before['min_ms'] if before['min_ms'] else float('inf')
+        flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{name:<40} {before['min_ms']:>12.3f} {now['min_ms']:>12.3f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks.")
+    parser.add_argument('--only', nargs='+', choices=sorted(GROUPS), default=sorted(GROUPS),
+                        help="benchmark groups to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs of each benchmark (default: %(default)s)")
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON results file (default: %(default)s)")
+    parser.add_argument('--compare', help="earlier results file to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="slowdown ratio reported as a regression (default: %(default)s)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = None
+    if args.compare:
+        # read first, --compare and --output may be the same file
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results, status = {}, {}
+    workdir = tempfile.mkdtemp(prefix='pepper_bench_')
+    try:
+        for group in args.only:
+            start = time.perf_counter()
+            status[group] = GROUPS[group](results, args.repeat, workdir)
+            print(f"INFO: {group}: {status[group]} ({time.perf_counter() - start:.1f} s)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "groups": status,
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    print(f"INFO: {len(results)} results saved to '{args.output}'")
+
+    if baseline is None:
+        for name, r in sorted(results.items()):
+            print(f"{name:<40} {r['median_ms']:>12.3f} ms")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {100 * args.tolerance:.0f}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Fast-forward replay of whole interaction sessions on a virtual clock.
+
+interaction() takes every wait (speech holds, pauses, reading time) from
+the clock passed in SESSION_CLOCK, and ReplayIM answers the tablet
+questions from a script, moving that clock forward by the response time
+of each answer. A session of several minutes is replayed in milliseconds
+with the real session functions, attention logs and scoring, and writes
+the same benchmark_log.csv rows as a real run.
+
+A replay script is a JSON file:
+
+    {"name": "science_attentive",
+     "attention_log": "attention_log_attentive.csv",
+     "answers": [["lessons", 2.0], ["science", 3.5], "sunlight", ...],
+     "settings": {"READING_PACING": "adaptive", "QUIZ_SEED": "1"},
+     "expect": [{"TopicName": "Photosynthesis", "IsCorrect": "1", ...}, ...]}
+
+An answer is [answer, seconds the student took] or just the answer (1 s).
+Sessions traced with SESSION_TRACE=1 can be replayed directly: their
+"answer" spans hold the answers and response times.
+
+    python session_replay.py replays/*.json
+    python session_replay.py --trace session_trace.jsonl
+    python session_replay.py replays/new.json --update
+
+replays every session, compares its benchmark rows with `expect` and
+exits with 1 on any difference; --update stores the current rows as the
+expected ones. The quiz topics are drawn from QUIZ_SEED, the name of the
+script unless its settings give one. Speech and gestures go to
+fake_naoqi and take no virtual time. Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import contextlib
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import session_runtime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Columns compared with the expected rows (ids and timestamps differ per run)
+COMPARED_FIELDS = ['TopicName', 'AttentionScore', 'IsCorrect', 'FeedbackType', 'Subject', 'Mode']
+DEFAULT_THINK_TIME = 1.0
+
+
+class VirtualClock(object):
+    # interaction_scheduler.Clock whose sleep() only moves the time forward
+
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else start
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.now += seconds
+
+    def wait(self, event, timeout=None):
+        # Speech and gestures of the fake backends end at once; the real
+        # timeout is only a guard against a stuck thread
+        return event.wait(timeout)
+
+
+class ReplayIM(session_runtime.ScriptedIM):
+    # Tablet stand-in answering after the recorded response time
+
+    def __init__(self, path, answers, clock):
+        session_runtime.ScriptedIM.__init__(self, path, [])
+        self.answers = [a if isinstance(a, (list, tuple)) else (a, DEFAULT_THINK_TIME) for a in answers]
+        self.clock = clock
+
+    def ask(self, action=None, timeout=-1):
+        if action is not None:
+            self.execute(action)
+        if not self.answers:
+            return self.final_answer
+        answer, seconds = self.answers.pop(0)
+        if timeout is not None and 0 < timeout < seconds:
+            self.clock.sleep(timeout)
+            return 'timeout'
+        self.clock.sleep(seconds)
+        return answer
+
+
+def load_script(path):
+    with io.open(path, encoding='utf-8') as f:
+        script = json.load(f)
+    script.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    script['path'] = path
+    return script
+
+
+def scripts_from_trace(path):
+    # One replay script per session of a session_trace.jsonl file
+    sessions = {}
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get("type") != "span":
+                continue
+            script = sessions.setdefault(entry["session"], {"name": entry["session"], "answers": [],
+                                                            "settings": {}, "start": entry["start"]})
+            if entry["name"] == "session":
+                script["attention_log"] = entry.get("attention_log")
+                for key, setting in (("reading_pacing", "READING_PACING"), ("quiz_seed", "QUIZ_SEED")):
+                    if entry.get(key):
+                        script["settings"][setting] = entry[key]
+            elif entry["name"] == "answer":
+                script["answers"].append([entry["answer"], entry["duration_ms"] / 1000.0])
+    return [sessions[k] for k in sorted(sessions, key=lambda k: sessions[k]["start"])]
+
+
+def read_rows(path):
+    if not os.path.exists(path):
+        return []
+    with io.open(path, encoding='utf-8', newline='') as f:
+        return [dict((k, row.get(k, '')) for k in COMPARED_FIELDS) for row in csv.DictReader(f)]
+
+
+class ReplayResult(object):
+
+    def __init__(self, name, rows, virtual_s, wall_s, error, shown):
+        self.name = name
+        self.rows = rows
+        self.virtual_s = virtual_s      # session time on the virtual clock
+        self.wall_s = wall_s            # time the replay took
+        self.error = error
+        self.shown = shown              # (modality or 'action', value) sent to the tablet
+
+    @property
+    def speedup(self):
+        return self.virtual_s / self.wall_s if self.wall_s > 0 else 0.0
+
+
+class Replayer(object):
+
+    def __init__(self, root=None, script=session_runtime.DEFAULT_SCRIPT):
+        self.root = root or os.path.dirname(HERE)
+        self.code = session_runtime.load_interaction(script)
+
+    def replay(self, script):
+        import fake_naoqi
+        fake_naoqi.reset()
+        workdir = tempfile.mkdtemp(prefix='pepper_replay_')
+        try:
+            log_file = os.path.join(workdir, 'benchmark_log.csv')
+            config = {'PEPPER_FAKE_NAOQI': '1', 'PEPPER_IP': 'replay', 'TTS_CACHE': '0',
+                      'SESSION_TRACE': '0', 'ATTENTION_SOURCE': 'log',
+                      'BENCHMARK_LOG_FILE': log_file, 'SESSION_ID': script['name'],
+                      'QUIZ_SEED': script['name']}
+            if script.get('attention_log'):
+                config['ATTENTION_LOG_FILE'] = script['attention_log']
+            config.update(script.get('settings') or {})
+
+            clock = VirtualClock(script.get('start'))
+            im = ReplayIM(self.root, script.get('answers', []), clock)
+            session = session_runtime.Session(script['name'], im, config, session_clock=clock)
+            virtual_start, wall_start = clock.time(), time.time()
+            session.run(self.code)
+            wall = time.time() - wall_start
+            return ReplayResult(script['name'], read_rows(log_file), clock.time() - virtual_start,
+                                wall, session.error, im.shown)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def differences(rows, expected):
+    # Human readable differences between the replayed and the expected rows
+    out = []
+    if len(rows) != len(expected):
+        out.append("%d rows, expected %d" % (len(rows), len(expected)))
+    for i, (row, exp) in enumerate(zip(rows, expected)):
+        for field in COMPARED_FIELDS:
+            if field in exp and u'%s' % exp[field] != row[field]:
+                out.append("row %d %s: %r, expected %r" % (i + 1, field, row[field], exp[field]))
+    return out
+
+
+@contextlib.contextmanager
+def _stdout_to(stream):
+    # contextlib.redirect_stdout, also on Python 2.7
+    import sys
+    saved, sys.stdout = sys.stdout, stream
+    try:
+        yield
+    finally:
+        sys.stdout = saved
+
+
+def main():
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Replay interaction sessions on a virtual clock.")
+    parser.add_argument('scripts', nargs='*', help="replay scripts (.json)")
+    parser.add_argument('--trace', action='append', default=[], help="replay the sessions of a trace file")
+    parser.add_argument('--root', default=os.path.dirname(HERE), help="MODIM app folder")
+    parser.add_argument('--update', action='store_true', help="store the replayed rows as expected")
+    parser.add_argument('--verbose', action='store_true', help="show the output of the sessions")
+    args = parser.parse_args()
+
+    scripts = [load_script(p) for p in args.scripts]
+    for path in args.trace:
+        scripts.extend(scripts_from_trace(path))
+    if not scripts:
+        parser.error("no replay script given")
+
+    replayer = Replayer(args.root)
+    failed = 0
+    print("%-28s %-6s %10s %9s %9s %5s" % ("session", "status", "virtual s", "wall ms", "speedup", "rows"))
+    for script in scripts:
+        if args.verbose:
+            result = replayer.replay(script)
+        else:
+            with open(os.devnull, 'w') as sink, _stdout_to(sink):
+                result = replayer.replay(script)
+        problems = [result.error] if result.error else []
+        if args.update and 'path' in script and not result.error:
+            script_out = dict((k, v) for k, v in script.items() if k != 'path')
+            script_out['expect'] = result.rows
+            with io.open(script['path'], 'w', encoding='utf-8') as f:
+                f.write(u'%s\n' % json.dumps(script_out, indent=1, sort_keys=True, ensure_ascii=False))
+        elif 'expect' in script:
+            problems.extend(differences(result.rows, script['expect']))
+        status = "FAIL" if problems else ("ok" if 'expect' in script or args.update else "run")
+        failed += bool(problems)
+        print("%-28s %-6s %10.1f %9.1f %8.0fx %5d" % (result.name[:28], status, result.virtual_s,
+                                                     1000.0 * result.wall_s, result.speedup, len(result.rows)))
+        for problem in problems:
+            print("    %s" % problem)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Several interaction sessions (robots or tablets) served by one process.
+
+MODIM runs interaction() of pepper_interaction.py with a global `im`, so
+one process can drive one session only. SessionRuntime compiles that
+function once and runs it in one thread per session, each in its own
+namespace: its own `im`, robot_say / robot_gesture globals, dependencies,
+results writer and tracer. Per-session settings (PEPPER_IP, PEPPER_PORT,
+ATTENTION_LOG_FILE, ...) are passed in SESSION_CONFIG and override the
+environment. What is safe to share stays shared: one NAOqi connection per
+robot, the attention log cache, the TTS cache of a robot.
+
+Every `im` is wrapped in a TimedIM, which times the MODIM calls of its
+session; report() gives the per-session duration, throughput and latency.
+
+    python session_runtime.py --sessions 4
+
+runs four sessions against local stand-ins: ScriptedIM answers from a
+script instead of a tablet, fake_naoqi replaces the robots. Unless --root
+is given they run in a throwaway copy of the app (scratch_root()), so the
+benchmark log and the TTS cache of the repo are left alone.
+Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import ast
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+
+from session_trace import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DEFAULT_SCRIPT = os.path.join(HERE, 'pepper_interaction.py')
+DEFAULT_ANSWERS = ['lessons', 'history', 'augustus', 'pyramids', 'columbus', 'back',
+                   'quiz', 'sunlight', 'augustus', 'pi', 'piano', 'exit']
+
+
+def load_interaction(script=DEFAULT_SCRIPT, name='interaction'):
+    # Code object defining the function `name` of a MODIM script, without
+    # running the rest of the module (MODIM client imports). Functions
+    # nested in interaction() can be loaded too, if they only use globals
+    with open(script, 'rb') as f:
+        tree = ast.parse(f.read())
+    found = [n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef) and n.name == name]
+    if not found:
+        raise ValueError("%s has no function %s()" % (script, name))
+    tree.body = found[:1]
+    return compile(tree, script, 'exec')
+
+
+def scratch_root(workdir, root=ROOT):
+    # MODIM app folder in workdir linking the actions, images, grammars and
+    # scripts of `root`, with a scripts/ folder of its own for the files a
+    # session writes (benchmark log, TTS cache, traces)
+    app = os.path.join(workdir, 'app')
+    scripts = os.path.join(root, 'scripts')
+    os.makedirs(os.path.join(app, 'scripts'))
+    for name in ('actions', 'img', 'grammars', 'init', 'actions.bundle.json'):
+        if os.path.exists(os.path.join(root, name)):
+            os.symlink(os.path.join(root, name), os.path.join(app, name))
+    for name in os.listdir(scripts):
+        if name.endswith('.py') or (name.startswith('attention_') and name.endswith('.csv')):
+            os.symlink(os.path.join(scripts, name), os.path.join(app, 'scripts', name))
+    return app
+
+
+class ScriptedIM(object):
+    # Tablet stand-in: records what would be shown, answers ask() from a script
+
+    def __init__(self, path, answers, think_time=0.0, final_answer='exit'):
+        self.path = path
+        self.answers = list(answers)
+        self.think_time = think_time        # seconds before each answer
+        self.final_answer = final_answer
+        self.shown = []
+
+    def execute(self, action):
+        self.shown.append(('action', action))
+
+    def executeModality(self, modality, value):
+        self.shown.append((modality, value))
+
+    def ask(self, action=None, timeout=-1):
+        if action is not None:
+            self.execute(action)
+        if self.think_time:
+            time.sleep(self.think_time)
+        return self.answers.pop(0) if self.answers else self.final_answer
+
+
+class TimedIM(object):
+    # MODIM interaction manager proxy timing every call
+
+    TIMED = ('execute', 'executeModality', 'ask')
+
+    def __init__(self, im, clock=time.time):
+        self._im = im
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.latencies = {}     # method -> list of seconds
+
+    def __getattr__(self, attr):
+        target = getattr(self._im, attr)
+        if attr not in self.TIMED:
+            return target
+
+        def _timed(*args, **kwargs):
+            start = self._clock()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.latencies.setdefault(attr, []).append(self._clock() - start)
+        return _timed
+
+
+class Session(object):
+
+    def __init__(self, session_id, im, config=None, clock=time.time, session_clock=None):
+        self.session_id = session_id
+        self.im = TimedIM(im, clock)
+        self.config = dict(config or {})
+        self.clock = clock
+        self.session_clock = session_clock      # interaction_scheduler.Clock-like, for the pacing
+        self.start = self.end = None
+        self.error = None
+        self.thread = None
+
+    def run(self, code):
+        namespace = {'im': self.im, 'SESSION_CONFIG': self.config,
+                     'SESSION_CLOCK': self.session_clock,
+                     '__name__': 'session_%s' % self.session_id}
+        self.start = self.clock()
+        try:
+            exec(code, namespace)
+            namespace['interaction']()
+        except Exception as e:
+            self.error = "%s: %s" % (type(e).__name__, e)
+            traceback.print_exc()
+        finally:
+            self.end = self.clock()
+
+    def report(self):
+        duration = (self.end or self.clock()) - (self.start or self.clock())
+        calls = sum(len(v) for v in self.im.latencies.values())
+        out = {
+            "session": self.session_id,
+            "status": "error" if self.error else ("done" if self.end else "running"),
+            "error": self.error,
+            "duration_s": round(duration, 3),
+            "im_calls": calls,
+            "calls_per_s": round(calls / duration, 2) if duration > 0 else 0.0,
+            "methods": {},
+        }
+        for method, values in self.im.latencies.items():
+            values = sorted(values)
+            out["methods"][method] = {
+                "count": len(values),
+                "p50_ms": round(1000.0 * percentile(values, 50), 1),
+                "p95_ms": round(1000.0 * percentile(values, 95), 1),
+            }
+        return out
+
+
+class SessionRuntime(object):
+
+    def __init__(self, script=DEFAULT_SCRIPT, clock=time.time):
+        self.code = load_interaction(script)
+        self.clock = clock
+        self.sessions = []
+
+    def add(self, session_id, im, config=None, session_clock=None):
+        session = Session(session_id, im, config, self.clock, session_clock)
+        self.sessions.append(session)
+        return session
+
+    def start(self):
+        for session in self.sessions:
+            if session.thread is None:
+                session.thread = threading.Thread(target=session.run, args=(self.code,),
+                                                  name='session-%s' % session.session_id)
+                session.thread.daemon = True
+                session.thread.start()
+
+    def join(self, timeout=None):
+        for session in self.sessions:
+            if session.thread is not None:
+                session.thread.join(timeout)
+
+    def run(self):
+        # Run every session to the end, returns their reports
+        self.start()
+        self.join()
+        return self.report()
+
+    def report(self):
+        return [session.report() for session in self.sessions]
+
+
+def print_report(reports):
+    print("\n==== SESSIONS ====")
+    print("%-12s %-7s %10s %8s %9s %10s %10s" % ("session", "status", "duration s", "calls", "calls/s",
+                                                 "ask p50 ms", "show p95 ms"))
+    for r in reports:
+        show = r["methods"].get("executeModality", {"p95_ms": 0.0})
+        ask = r["methods"].get("ask", {"p50_ms": 0.0})
+        print("%-12s %-7s %10.1f %8d %9.2f %10.1f %10.1f" % (r["session"], r["status"], r["duration_s"],
+                                                             r["im_calls"], r["calls_per_s"],
+                                                             ask["p50_ms"], show["p95_ms"]))
+        if r["error"]:
+            print("    %s" % r["error"])
+
+
+def main():
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Run several interaction sessions against local stand-ins.")
+    parser.add_argument('--sessions', type=int, default=2)
+    parser.add_argument('--root', default=None,
+                        help="MODIM app folder (default: a throwaway copy of this one)")
+    parser.add_argument('--answers', nargs='+', default=DEFAULT_ANSWERS,
+                        help="answers given by every scripted student")
+    parser.add_argument('--think-time', type=float, default=0.0, help="seconds before each answer")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="setting of every session, e.g. TTS_CACHE=0")
+    parser.add_argument('--report', default=None, help="write the reports to this JSON file")
+    args = parser.parse_args()
+
+    common = dict(kv.split('=', 1) for kv in args.set)
+    workdir = None if args.root else tempfile.mkdtemp(prefix='pepper_sessions_')
+    try:
+        root = args.root or scratch_root(workdir)
+        runtime = SessionRuntime()
+        for i in range(args.sessions):
+            config = {'PEPPER_FAKE_NAOQI': '1', 'PEPPER_IP': 'fake-robot-%d' % i}
+            config.update(common)
+            runtime.add('s%d' % i, ScriptedIM(root, args.answers, args.think_time), config)
+        reports = runtime.run()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_report(reports)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=1, sort_keys=True)
+    return 1 if any(r["error"] for r in reports) else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
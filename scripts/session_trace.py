@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Per-step latency tracing of interaction sessions.
+
+A Tracer records one timed span per interaction step (im.execute, im.ask,
+speech, gestures, holds, attention scoring), tagged with the current
+subject and topic and with the action name. Spans are appended as JSON
+lines to a trace file, followed by a per-session summary with the p50/p95
+latency of every step name.
+
+Tracing costs one clock read and a list append per span; when disabled
+(`enabled = False`, can be switched at any time) span() returns a shared
+no-op context. Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import json
+import threading
+import time
+import uuid
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+
+    def __init__(self, tracer, name, tags):
+        self._tracer = tracer
+        self._name = name
+        self._tags = tags
+
+    def __enter__(self):
+        self._start = self._tracer.clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        tags = self._tags
+        if exc_type is not None:
+            tags = dict(tags, error=exc_type.__name__)
+        self._tracer.record(self._name, self._start, self._tracer.clock(), **tags)
+        return False
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    idx = int(round(q / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[idx]
+
+
+class Tracer(object):
+
+    def __init__(self, path=None, enabled=True, clock=None, session_id=None, flush_every=50):
+        self.path = path
+        self.enabled = enabled
+        self.clock = clock or time.time
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.context = {}
+        self._pending = []
+        self._durations = {}     # span name -> list of seconds
+        self._flush_every = flush_every
+        self._lock = threading.Lock()
+
+    def set_context(self, **tags):
+        # Tags added to every following span (None removes a tag)
+        for key, value in tags.items():
+            if value is None:
+                self.context.pop(key, None)
+            else:
+                self.context[key] = value
+
+    def span(self, name, **tags):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, tags)
+
+    def record(self, name, start, end, **tags):
+        # Add a span measured by the caller (e.g. in another thread)
+        if not self.enabled:
+            return
+        entry = dict(self.context)
+        entry.update(tags)
+        entry.update({"type": "span", "session": self.session_id, "name": name,
+                      "start": start, "duration_ms": round(1000.0 * (end - start), 3)})
+        with self._lock:
+            self._pending.append(entry)
+            self._durations.setdefault(name, []).append(end - start)
+            if len(self._pending) >= self._flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self.path and self._pending:
+            # one append per flush, so sessions sharing the file do not interleave lines
+            data = ''.join(json.dumps(entry, sort_keys=True) + '\n' for entry in self._pending)
+            with open(self.path, 'a') as f:
+                f.write(data)
+        del self._pending[:]
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def summary(self):
+        # {span name: {count, total_s, p50_ms, p95_ms, max_ms}}
+        out = {}
+        with self._lock:
+            for name, values in self._durations.items():
+                values = sorted(values)
+                out[name] = {
+                    "count": len(values),
+                    "total_s": round(sum(values), 3),
+                    "p50_ms": round(1000.0 * percentile(values, 50), 1),
+                    "p95_ms": round(1000.0 * percentile(values, 95), 1),
+                    "max_ms": round(1000.0 * values[-1], 1),
+                }
+        return out
+
+    def close(self):
+        # Write the remaining spans and the session summary, print the summary
+        summary = self.summary()
+        if not summary:
+            return summary
+        with self._lock:
+            self._pending.append({"type": "summary", "session": self.session_id, "steps": summary})
+            self._flush_locked()
+        print("\n==== SESSION %s STEP LATENCY ====" % self.session_id)
+        print("%-28s %6s %10s %10s %10s" % ("step", "count", "total s", "p50 ms", "p95 ms"))
+        for name in sorted(summary, key=lambda n: -summary[n]["total_s"]):
+            s = summary[name]
+            print("%-28s %6d %10.1f %10.1f %10.1f" % (name, s["count"], s["total_s"], s["p50_ms"], s["p95_ms"]))
+        return summary
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-synthesized audio for the fixed phrases Pepper says in every lesson.
+
+PhraseCache renders a list of phrases to audio files once per (language,
+speed, volume) setting and plays them back from the files, so a cached
+phrase starts without the synthesis delay. A Speaker says a text from the
+cache when it can and with the live TTS otherwise (dynamic phrases, or
+phrases not rendered yet). Rendering runs in a background thread, phrases
+become available as they are done.
+
+A backend provides synthesize(text, path), play(path, wait) and exists(path):
+  - RobotBackend: ALTextToSpeech.sayToFile and ALAudioPlayer.playFile,
+    the files stay on the robot;
+  - LocalBackend: off-robot stand-in, writes silent WAV files as long as
+    the phrase would be and "plays" them by sleeping their duration.
+
+The list of rendered phrases is kept in an index file next to the
+interaction scripts, per robot and setting, so the files are synthesized
+only once. Entries read from the index are used once the render thread
+has checked that their file still exists (backend.exists), missing ones
+are rendered again. A phrase whose file cannot be played is dropped from
+the index of its robot and said live.
+
+Sessions running in the same process share one cache per robot and
+setting (shared_cache), each one with its own Speaker bound to the live
+TTS of its robot. Compatible with Python 2.7.
+"""
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import threading
+import time
+import wave
+
+# Existing folder on the robot, sayToFile does not create folders
+ROBOT_CACHE_DIR = '/home/nao'
+INDEX_FILE = 'tts_cache_index.json'
+
+# Index files are shared by the caches of every setting
+_index_lock = threading.Lock()
+
+
+def _utf8(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+
+def setting_key(language, speed, volume):
+    return "%s_%d_%d" % (language, int(speed), int(round(100 * volume)))
+
+
+def phrase_key(text):
+    return hashlib.sha1(_utf8(text.strip())).hexdigest()[:16]
+
+
+class LocalBackend(object):
+    # Off-robot synthesizer and player: silent 16 kHz WAV files
+
+    def __init__(self, chars_per_second=14.0, synth_delay=0.0, clock=None):
+        self.chars_per_second = chars_per_second
+        self.synth_delay = synth_delay          # simulated synthesis time per phrase
+        self.clock = clock or time
+        self.played = []
+
+    def synthesize(self, text, path):
+        self.clock.sleep(self.synth_delay)
+        frames = int(16000 * len(text) / self.chars_per_second)
+        w = wave.open(path, 'wb')
+        try:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(16000)
+            w.writeframes(b'\x00\x00' * frames)
+        finally:
+            w.close()
+
+    def exists(self, path):
+        return os.path.isfile(path)
+
+    def play(self, path, wait=True):
+        w = wave.open(path, 'rb')
+        try:
+            duration = w.getnframes() / float(w.getframerate())
+        finally:
+            w.close()
+        self.played.append(path)
+        if wait:
+            self.clock.sleep(duration)
+
+
+class RobotBackend(object):
+    # Files rendered and played on the robot through a naoqi_session.NaoqiSession
+
+    def __init__(self, naoqi, language=None, speed=None, volume=None):
+        self._tts = naoqi.service("ALTextToSpeech")
+        self._audio = naoqi.service("ALAudioPlayer")
+        # sayToFile renders with the current parameters of the TTS service
+        for method, args in (("setLanguage", (language,)), ("setParameter", ("speed", speed)),
+                             ("setVolume", (volume,))):
+            if args[-1] is not None:
+                try:
+                    getattr(self._tts, method)(*args)
+                except Exception as e:
+                    print("WARNING: ALTextToSpeech.%s failed: %s" % (method, e))
+
+    def synthesize(self, text, path):
+        self._tts.sayToFile(text, path)
+
+    def exists(self, path):
+        # The files are on the robot: loadFile fails when there is none
+        try:
+            self._audio.unloadFile(self._audio.loadFile(path))
+            return True
+        except Exception:
+            return False
+
+    def play(self, path, wait=True):
+        if wait:
+            self._audio.playFile(path)
+        else:
+            self._audio.post.playFile(path)
+
+
+class PhraseCache(object):
+
+    def __init__(self, backend, cache_dir, index_path,
+                 language='Italian', speed=100, volume=1.0, local_files=True, robot='local'):
+        self.backend = backend
+        self.robot = robot                      # robots keep their files, and their index, apart
+        self.setting = setting_key(language, speed, volume)
+        self.cache_dir = cache_dir
+        self.index_path = index_path
+        self.local_files = local_files          # False when the files are on the robot
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._ready = {}
+        # entries of the index, trusted once the render thread found their file
+        self._unverified = self._load_index().get(robot, {}).get(self.setting, {})
+        self._thread = None
+
+    def _load_index(self):
+        # {robot: {setting: {phrase key: path}}}
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        # entries of the older {setting: {phrase key: path}} layout are dropped
+        return dict((robot, settings) for robot, settings in index.items()
+                    if all(isinstance(v, dict) for v in settings.values()))
+
+    def _save_index(self):
+        # Rewrite this robot and setting's entry, keeping the others of the file
+        with _index_lock:
+            index = self._load_index()
+            index.setdefault(self.robot, {})[self.setting] = self._ready
+            tmp = '%s.%d.tmp' % (self.index_path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(index, f, sort_keys=True, indent=1)
+            os.rename(tmp, self.index_path)
+
+    def path_for(self, text):
+        return '%s/tts_%s_%s.wav' % (self.cache_dir, self.setting, phrase_key(text))
+
+    def is_cached(self, text):
+        with self._lock:
+            return phrase_key(text) in self._ready
+
+    def render(self, phrases):
+        # Synthesize the phrases that are not cached yet; returns how many.
+        # Concurrent calls run one after the other, so nothing is rendered twice
+        with self._render_lock:
+            return self._render(phrases)
+
+    def _verify(self):
+        # Move the index entries whose file exists to the ready ones;
+        # True if some were dropped
+        with self._lock:
+            entries, self._unverified = self._unverified, {}
+        found = dict((key, path) for key, path in entries.items() if self.backend.exists(path))
+        with self._lock:
+            self._ready.update(found)
+        return len(found) < len(entries)
+
+    def _render(self, phrases):
+        dropped = self._verify()
+        todo = [p for p in phrases if p and not self.is_cached(p)]
+        if todo and self.local_files and not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        done = 0
+        for text in todo:
+            path = self.path_for(text)
+            try:
+                self.backend.synthesize(text, path)
+            except Exception as e:
+                print("WARNING: TTS cache could not render %r: %s" % (text, e))
+                continue
+            with self._lock:
+                self._ready[phrase_key(text)] = path
+            done += 1
+        if done or dropped:
+            with self._lock:
+                self._save_index()
+        return done
+
+    def render_async(self, phrases):
+        # Render in a background thread; each phrase is played once it is done
+        self._thread = threading.Thread(target=self.render, args=(list(phrases),))
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def play_cached(self, text, wait=True):
+        # Play the cached audio of `text`; False if there is none
+        with self._lock:
+            path = self._ready.get(phrase_key(text))
+        if path is None:
+            return False
+        try:
+            self.backend.play(path, wait)
+            return True
+        except Exception as e:
+            print("WARNING: cached phrase %s not playable (%s), saying it live" % (path, e))
+            with self._lock:
+                self._ready.pop(phrase_key(text), None)
+                self._save_index()
+            return False
+
+
+class Speaker(object):
+    # robot_say replacement: cached audio if there is one for the cache
+    # setting, live TTS otherwise (always for explicit speed or volume)
+
+    def __init__(self, cache, live_say):
+        self.cache = cache
+        self.live_say = live_say
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, text, speed=None, volume=None, wait=True):
+        if speed is None and volume is None and self.cache.play_cached(text, wait):
+            self.hits += 1
+            return
+        self.misses += 1
+        return self.live_say(text, speed=speed, volume=volume, wait=wait)
+
+
+# Caches of the process, one per (robot, cache folder, setting)
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(robot, cache_dir, index_path, language, speed, volume, backend_factory, local_files=True):
+    key = (robot, cache_dir, setting_key(language, speed, volume))
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = PhraseCache(backend_factory(), cache_dir, index_path,
+                                       language, speed, volume, local_files, robot)
+        return _shared[key]
+
+
+def expand_templates(templates, values):
+    # ["Adesso parliamo di %s."] x ["Photosynthesis", ...] -> phrases
+    return [t % v for t in templates for v in values]
@@ -0,0 +1,26 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from answer_matcher import compile_matcher
+
+GRAMMARS = os.path.join(ROOT, 'grammars')
+
+
+def test_longer_phrase_hides_its_words():
+    matcher = compile_matcher(GRAMMARS, answers=['sunlight', 'the_sun'])
+    assert not matcher.matches("sun light", "the_sun")
+    assert matcher.matches("sun light", "sunlight")
+    assert not matcher.matches("luce del sole", "the_sun")
+    assert matcher.matches("luce del sole", "sunlight")
+
+
+def test_synonyms_still_match():
+    matcher = compile_matcher(GRAMMARS, answers=['sunlight', 'the_sun'])
+    assert matcher.matches("the sun", "the_sun")
+    assert matcher.matches("I think it is the sun!", "the_sun")
+    assert matcher.matches("il sole", "the_sun")
+    assert matcher.matches("sole", "the_sun")
+    assert not matcher.matches("pineapple", "pi")